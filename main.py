@@ -1,72 +1,193 @@
-from utils.db.updateDB import update_players, update_matches
-from utils.stats.prepareStats import *
-from utils.stats.playerStats import *
-from utils.common.commonFunctions import logger, getFileValue
+import argparse
+import logging
+import sys
+import time
 
+# Heavy modules (pandas, pymongo, scikit-learn...) are imported by the commands that need them
+logger = logging.getLogger(__name__)
 
-def update_database(tournament: str):
-    print("Choose an option to update the database :")
-    print("   - a : Update players")
-    print("   - b : Update matches")
-    print("   - c : Update All")
-    choice = input("Enter your choice (a/b/c) : ").strip().lower()
+
+def update_database(tournament: str, choice=None, replay=False):
+    from utils.db.updateDB import update_players, update_matches
+
+    if choice is None:
+        print("Choose an option to update the database :")
+        print("   - a : Update players")
+        print("   - b : Update matches")
+        print("   - c : Update All")
+        print("   - d : Replay matches from the local response store (offline)")
+        print("   - e : Check and rebuild the head-to-head view")
+        choice = input("Enter your choice (a/b/c/d/e) : ").strip().lower()
 
     if choice == 'a':
         update_players(tournament)
     elif choice == 'b':
-        update_matches(tournament)
+        update_matches(tournament, replay=replay)
     elif choice == 'c':
         update_players(tournament)
-        update_matches(tournament)
+        update_matches(tournament, replay=replay)
+    elif choice == 'd':
+        update_matches(tournament, replay=True)
+    elif choice == 'e':
+        from utils.common.commonFunctions import logToDB
+        from utils.db.h2hView import check_h2h, rebuild_h2h
+        db = logToDB(tournament)
+        differences = check_h2h(db)
+        if differences:
+            logger.warning(f"h2h view differs from the matches for {len(differences)} pairs: {differences[:10]}")
+        rebuild_h2h(db)
     else:
         logger.error("Invalid choice.")
 
 
-def update_statistics(tournament: str):
-    print("Choose an option to update the statistics :")
-    print("a : Update player statistics")
-    print("b : Update champion pool")
-    print("c : Update champion statistics")
-    print("d : Update All")
-    print("e : Get the Head-to-Head (H2H)")
-    choice = input("Enter your choice (a/b/c/d/e) : ").strip().lower()
+def update_statistics(tournament: str, full=False, server_side=False, choice=None):
+    from utils.stats.prepareStats import generate_player_match_stats
 
-    generate_player_match_stats(tournament)
+    if choice is None:
+        print("Choose an option to update the statistics :")
+        print("a : Update player statistics")
+        print("b : Update champion pool")
+        print("c : Update champion statistics")
+        print("d : Update All")
+        print("e : Get the Head-to-Head (H2H)")
+        print("f : Timeline events (first objectives, gold leads, comebacks)")
+        choice = input("Enter your choice (a/b/c/d/e/f) : ").strip().lower()
+
+    generate_player_match_stats(tournament, full=full)
 
     if choice == 'a':
-        generate_players_stats(tournament)
-    elif choice == 'b':
-        logger.info("Update champion pool...")
-        # update_champion_pool(tournament)
-    elif choice == 'c':
-        logger.info("Update champion statistics")
-        # update_champion_stats(tournament)
-    elif choice == 'd':
-        logger.info("Update All...")
-        # update_player_stats(tournament)
-        # update_champion_pool(tournament)
-        # update_champion_stats(tournament)
-    elif choice == 'e':
-        logger.info("Obtaining Head-to-Head (H2H)...")
-        # get_H2H(tournament)
+        from utils.stats.playerStats import generate_players_stats
+        generate_players_stats(tournament, server_side=server_side)
+    elif choice in ('b', 'c', 'd', 'e'):
+        from utils.stats.analytics import generate_analytics, REPORTS
+        # one load of stats_players shared by every requested report
+        reports = {'b': ["pool"], 'c': ["champions"], 'd': REPORTS, 'e': ["h2h"]}[choice]
+        generate_analytics(tournament, reports, server_side=server_side)
+    elif choice == 'f':
+        from utils.stats.timelineEvents import generate_timeline_features
+        generate_timeline_features(tournament, full=full)
     else:
         logger.error("Invalid choice.")
 
 
-def main():
-    tournament = getFileValue("TOORNAMENT_NAME", ".env")
-    print("Choose an option  :")
-    print("1 : Update the database")
-    print("2 : Update statistics")
-    choice = input("Enter your choice (1/2) : ").strip()
+def run_daemon(tournament: str, live_interval: int, idle_interval: int, export=True, server_side=False,
+               on_cycle=None):
+    from utils.db.liveDaemon import run_daemon as daemon
 
-    if choice == '1':
-        update_database(tournament)
-    elif choice == '2':
-        update_statistics(tournament)
-    else:
-        logger.error("Invalid choice.")
+    daemon(tournament, live_interval=live_interval, idle_interval=idle_interval, export=export,
+           server_side=server_side, on_cycle=on_cycle)
+
+
+def write_run_report(tournament: str, run_id: str, prometheus_textfile=None, profiler=None):
+    """write the stage report of the run (and the profile of the hot functions) in tournaments/<name>/reports"""
+    from utils.common.runReport import run_report
+
+    path = f"tournaments/{tournament}/reports/run_{run_id}"
+    run_report.write(f"{path}.json")
+    if prometheus_textfile:
+        run_report.write_prometheus(prometheus_textfile)
+    if profiler is not None:
+        import os
+        import pstats
+        import re
+        profiler.dump_stats(f"{path}.prof")
+        with open(f"{path}_profile.txt", "w") as file:
+            # project functions only, sorted by cumulative time
+            project = re.escape(os.path.dirname(os.path.abspath(__file__)))
+            pstats.Stats(profiler, stream=file).sort_stats("cumulative").print_stats(project, 40)
+    logger.info(f"Run report written at {path}.json")
+
+
+# Subcommand targets mapped to the menu choices
+UPDATE_CHOICES = {"players": 'a', "matches": 'b', "all": 'c', "h2h": 'e'}
+STATS_CHOICES = {"players": 'a', "pool": 'b', "champions": 'c', "all": 'd', "h2h": 'e', "timeline": 'f'}
+
+
+def add_common_arguments(parser, subcommand=False):
+    """options accepted before or after the subcommand"""
+    default = {"default": argparse.SUPPRESS} if subcommand else {}
+    parser.add_argument("--tournament", help="tournament name (default: TOORNAMENT_NAME of the .env file)",
+                        **default)
+    parser.add_argument("--full", action="store_true", help="rebuild the whole stats_players table", **default)
+    parser.add_argument("--server-side", action="store_true",
+                        help="compute the player statistics with a MongoDB aggregation", **default)
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the run with cProfile (tournaments/<name>/reports/run_<date>.prof) "
+                             "and measure the bytes read from MongoDB", **default)
+    parser.add_argument("--prometheus-textfile", metavar="PATH",
+                        help="also write the run report in the Prometheus textfile format", **default)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extia Gaming LoL Stats. Without a command, the interactive menu is displayed.")
+    add_common_arguments(parser)
+    commands = parser.add_subparsers(dest="command")
+
+    update = commands.add_parser("update", help="update the database")
+    update.add_argument("target", choices=list(UPDATE_CHOICES))
+    update.add_argument("--replay", action="store_true",
+                        help="rebuild the matches from the local response store, without calling the API")
+    add_common_arguments(update, subcommand=True)
+
+    stats = commands.add_parser("stats", help="update the statistics")
+    stats.add_argument("target", choices=list(STATS_CHOICES))
+    add_common_arguments(stats, subcommand=True)
+
+    daemon = commands.add_parser("daemon", help="poll and ingest the games during the tournament window, "
+                                                "then refresh the statistics and the export")
+    daemon.add_argument("--live-interval", type=int, default=120,
+                        help="seconds between two polls during the tournament window (default: 120)")
+    daemon.add_argument("--idle-interval", type=int, default=1800,
+                        help="seconds between two checks before the tournament window (default: 1800)")
+    daemon.add_argument("--no-export", action="store_true", help="do not regenerate players_stats.xlsx")
+    add_common_arguments(daemon, subcommand=True)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+
+    from utils.common.commonFunctions import getFileValue
+    tournament = arguments.tournament or getFileValue("TOORNAMENT_NAME", ".env")
+    run_id = time.strftime("%Y%m%d_%H%M%S")
+    from utils.common.runReport import run_report
+    run_report.start(measure_bytes=arguments.profile)  # re-encodes the Mongo replies, only when profiling
+
+    profiler = None
+    if arguments.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        if arguments.command == "update":
+            update_database(tournament, choice=UPDATE_CHOICES[arguments.target], replay=arguments.replay)
+        elif arguments.command == "stats":
+            update_statistics(tournament, full=arguments.full, server_side=arguments.server_side,
+                              choice=STATS_CHOICES[arguments.target])
+        elif arguments.command == "daemon":
+            run_daemon(tournament, arguments.live_interval, arguments.idle_interval,
+                       export=not arguments.no_export, server_side=arguments.server_side,
+                       on_cycle=lambda: write_run_report(tournament, run_id, arguments.prometheus_textfile))
+        else:
+            print("Choose an option  :")
+            print("1 : Update the database")
+            print("2 : Update statistics")
+            choice = input("Enter your choice (1/2) : ").strip()
+
+            if choice == '1':
+                update_database(tournament)
+            elif choice == '2':
+                update_statistics(tournament, full=arguments.full, server_side=arguments.server_side)
+            else:
+                logger.error("Invalid choice.")
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        write_run_report(tournament, run_id, arguments.prometheus_textfile, profiler)
 
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
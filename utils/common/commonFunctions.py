@@ -1,7 +1,9 @@
 from pymongo import MongoClient
 from pymongo.server_api import ServerApi
-from sklearn.preprocessing import MinMaxScaler
+from utils.db.migrations import bootstrap_schema
+from utils.common.runReport import MongoCommandListener
 import logging
+import threading
 
 # Logging config
 logging.basicConfig(level=logging.INFO)
@@ -32,38 +34,89 @@ def getFileValue(param: str, filename: str):
                 return line.strip().split("=", 1)[1]
 
 
+# Optional MongoClient settings read from the .env file
+MONGODB_OPTIONS = {
+    "MONGODB_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGODB_MIN_POOL_SIZE": "minPoolSize",
+    "MONGODB_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGODB_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGODB_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    "MONGODB_MAX_IDLE_TIME_MS": "maxIdleTimeMS"
+}
+
+# Process-wide client (one connection pool) and databases already checked
+mongo_clients = {}
+mongo_databases = {}
+mongo_lock = threading.Lock()
+
+
+def getMongoClient(mode="ONLINE"):
+    """return the process-wide MongoClient, created on first use"""
+    with mongo_lock:
+        if mode not in mongo_clients:
+            mongodb_uri = getFileValue("MONGODB_URI", ".env")
+            options = {option: int(getFileValue(param, ".env"))
+                       for param, option in MONGODB_OPTIONS.items() if getFileValue(param, ".env")}
+            options["event_listeners"] = [MongoCommandListener()]  # operations and bytes read in the run report
+
+            if mode == "ONLINE":
+                client = MongoClient(mongodb_uri, server_api=ServerApi('1'), **options)
+            else:
+                # Parse MONGODB_URI to extract PATH and HOST values
+                mongodb_host = mongodb_uri.split(":")[0]
+                mongodb_port = int(mongodb_uri.split(":")[1])
+
+                # Manage Database Connection
+                client = MongoClient(mongodb_host, mongodb_port, **options)
+            mongo_clients[mode] = client
+        return mongo_clients[mode]
+
+
+def setMongoClient(client, mode="ONLINE"):
+    """use an existing client (e.g. a local server or an in-memory stand-in for benchmarks) for a mode"""
+    with mongo_lock:
+        mongo_clients[mode] = client
+        for key in [key for key in mongo_databases if key[0] == mode]:
+            del mongo_databases[key]
+
+
 def logToDB(tournament: str, mode="ONLINE"):
-    """return connection to the requested mongo DB"""
+    """return connection to the requested mongo DB
+       -the client and the database handle are shared by the whole process
+       -the database checks and the schema bootstrap run on the first connection only
+    """
+    if (mode, tournament) in mongo_databases:
+        return mongo_databases[(mode, tournament)]
+
     try:
-        mongodb_uri = getFileValue("MONGODB_URI", ".env")
+        client = getMongoClient(mode)
         db_name = tournament
 
-        if mode == "ONLINE":
-            client = MongoClient(mongodb_uri, server_api=ServerApi('1'))
-        else:
-            # Parse MONGODB_URI to extract PATH and HOST values
-            mongodb_host = mongodb_uri.split(":")[0]
-            mongodb_port = int(mongodb_uri.split(":")[1])
+        with mongo_lock:
+            if (mode, tournament) in mongo_databases:
+                return mongo_databases[(mode, tournament)]
 
-            # Manage Database Connection
-            client = MongoClient(mongodb_host, mongodb_port)
+            # Check if the database exists, if not create it
+            if db_name not in client.list_database_names():
+                logger.info(f"Creating new database: {db_name}")
 
-        # Check if the database exists, if not create it
-        if db_name not in client.list_database_names():
-            logger.info(f"Creating new database: {db_name}")
+            db = client[db_name]
 
-        db = client[db_name]
+            # Ensure collections exist
+            collections = ["players", "matches", "timelines"]
+            existing_collections = db.list_collection_names()
+            for collection_name in collections:
+                if collection_name not in existing_collections:
+                    db.create_collection(collection_name)
+                    logger.info(f"Created collection: {collection_name} in database: {db_name}")
 
-        # Ensure collections exist
-        collections = ["players", "matches", "timelines"]
-        for collection_name in collections:
-            if collection_name not in db.list_collection_names():
-                db.create_collection(collection_name)
-                logger.info(f"Created collection: {collection_name} in database: {db_name}")
+            # Checking connection
+            client.server_info()
+            logger.info(f"Connection to MongoDB succeeded. Database: {db_name}")
 
-        # Checking connection
-        client.server_info()
-        logger.info(f"Connection to MongoDB succeeded. Database: {db_name}")
+            # Indexes and schema version
+            bootstrap_schema(db)
+            mongo_databases[(mode, tournament)] = db
 
     except Exception as e:
         logger.error(f"Connection failed to MongoDB: {str(e)}")
@@ -116,29 +169,10 @@ def scoring(stats_player, weightings: dict):
     :param weightings: Dictionnaire de pondération des statistiques pour chaque rôle.
     :return: DataFrame avec une colonne 'score' ajoutée.
     """
-    # Initialiser le scaler
-    scaler = MinMaxScaler()
-
-    # Initialiser une colonne score
-    stats_player["score"] = 0
-
-    # Normaliser les scores pour chaque rôle
-    for role, stats in weightings.items():
-        role_mask = stats_player["position"] == role
-        role_df = stats_player.loc[role_mask, list(stats.keys())]
+    from utils.common.scoringEngine import ScoringEngine  # scikit-learn is only loaded for scoring
 
-        # Normaliser chaque statistique individuellement
-        normalized_stats = scaler.fit_transform(role_df)
-
-        # Calculer le score pondéré
-        score = normalized_stats.dot(list(stats.values()))
-
-        # Mettre à jour la colonne score
-        stats_player.loc[role_mask, "score"] = score
-
-    # Normaliser le score final sur 100
-    stats_player["score"] = scaler.fit_transform(stats_player[["score"]]) * 100
+    # Normaliser une seule fois les statistiques utilisées, puis calculer le score pondéré
+    stats = list(dict.fromkeys(stat for role_stats in weightings.values() for stat in role_stats))
+    stats_player["score"] = ScoringEngine(stats_player, stats).score(weightings)
 
     return stats_player
-
-# TODO add scoring here
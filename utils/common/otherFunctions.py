@@ -1,28 +1,23 @@
 import pandas as pd
 
+# raw weights of the row-wise ranking, usable as a ScoringEngine profile
+legacy_weighting = {
+    "TOP": {"damageDealtToObjectives": 0.1, "damageSelfMitigated": 0.1, "damageTakenOnTeamPercentage": 0.3,
+            "damagePerMinute": 0.3, "kda": 0.1, "killParticipation": 0.1, "winrate": 0.2},  # add CC score, remove KP
+    "JGL": {"killParticipation": 0.2, "damageDealtToObjectives": 0.2, "kda": 0.1, "visionScorePerMinute": 0.1,
+            "damageTakenOnTeamPercentage": 0.2, "damagePerMinute": 0.2},  # remove kda
+    "MID": {"damagePerMinute": 0.3, "kda": 0.3, "killParticipation": 0.2, "CSPerMinute": 0.1,
+            "teamDamagePercentage": 0.1},  # add damageObjectif
+    "BOT": {"CSPerMinute": 0.2, "kda": 0.3, "damagePerMinute": 0.2, "killParticipation": 0.2,
+            "teamDamagePercentage": 0.1},  # replace CS by gold
+    "SUP": {"visionScorePerMinute": 0.3, "killParticipation": 0.3, "totalHealsOnTeammates": 0.2,
+            "totalDamageShieldedOnTeammates": 0.2}  # add CC score
+}
+
 
 # apply ranking algorithm
 def scoring(row):
-    if row['position'] == 'TOP':
-        return row['damageDealtToObjectives'] * 0.1 + row['damageSelfMitigated'] * 0.1 + \
-            row['damageTakenOnTeamPercentage'] * 0.3 + row['damagePerMinute'] * 0.3 + row['kda'] * 0.1 +\
-            row['killParticipation'] * 0.1 + row['winrate'] * 0.2
-    # add CC score, remove KP
-    elif row['position'] == 'JGL':
-        return row['killParticipation'] * 0.2 + row['damageDealtToObjectives'] * 0.2 + row['kda'] * 0.1 + \
-            row['visionScorePerMinute'] * 0.1 + row['damageTakenOnTeamPercentage'] * 0.2 + row['damagePerMinute'] * 0.2
-    # remove kda
-    elif row['position'] == 'MID':
-        return row['damagePerMinute'] * 0.3 + row['kda'] * 0.3 + row['killParticipation'] * 0.2 + \
-            row['CSPerMinute'] * 0.1 + row['teamDamagePercentage'] * 0.1
-    # add damageObjectif
-    elif row['position'] == 'BOT':
-        return row['CSPerMinute'] * 0.2 + row['kda'] * 0.3 + row['damagePerMinute'] * 0.2 + \
-            row['killParticipation'] * 0.2 + row['teamDamagePercentage'] * 0.1
-    # replace CS by gold
-    elif row['position'] == 'SUP':
-        return row['visionScorePerMinute'] * 0.3 + row['killParticipation'] * 0.3 + row['totalHealsOnTeammates'] * 0.2 \
-            + row['totalDamageShieldedOnTeammates'] * 0.2
-    # add CC score
-    else:
-        return 0  # default value
\ No newline at end of file
+    weights = legacy_weighting.get(row['position'])
+    if weights is None:
+        return 0  # default value
+    return sum(row[stat] * weight for stat, weight in weights.items())
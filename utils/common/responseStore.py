@@ -0,0 +1,73 @@
+import os
+import json
+import gzip
+import hashlib
+import threading
+
+
+class ResponseStore:
+    """Local store of raw API responses (match data and timelines) keyed by match id
+       -payloads are gzip compressed JSON files named by the sha256 of their content (objects/ab/abcd....json.gz)
+       -index.jsonl maps (kind, match_id) to the content hash, one line appended per stored response
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.index_path = os.path.join(root, "index.jsonl")
+        self.lock = threading.Lock()
+        self.index = {}
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.index.setdefault(entry["kind"], {})[entry["match_id"]] = entry["sha256"]
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.root, "objects", sha256[:2], f"{sha256}.json.gz")
+
+    def ids(self, kind: str) -> list:
+        """return the match ids stored for a kind ("match" or "timeline")"""
+        with self.lock:
+            return list(self.index.get(kind, {}))
+
+    def contains(self, kind: str, match_id: str) -> bool:
+        with self.lock:
+            return match_id in self.index.get(kind, {})
+
+    def get(self, kind: str, match_id: str):
+        """return the stored payload or None"""
+        with self.lock:
+            sha256 = self.index.get(kind, {}).get(match_id)
+        if sha256 is None:
+            return None
+        try:
+            with gzip.open(self.object_path(sha256), "rb") as file:
+                return json.loads(file.read())
+        except (OSError, ValueError):
+            return None
+
+    def put(self, kind: str, match_id: str, payload):
+        """store a payload, identical contents are written only once"""
+        content = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self.object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wb") as file:
+                file.write(content)
+            os.replace(tmp_path, path)
+
+        with self.lock:
+            if self.index.get(kind, {}).get(match_id) == sha256:
+                return
+            self.index.setdefault(kind, {})[match_id] = sha256
+            with open(self.index_path, "a") as file:
+                file.write(json.dumps({"kind": kind, "match_id": match_id, "sha256": sha256}) + "\n")
+
+
+def getResponseStore(tournament: str) -> ResponseStore:
+    """return the response store of a tournament (tournaments/<tournament>/cache)"""
+    return ResponseStore(f"tournaments/{tournament}/cache")
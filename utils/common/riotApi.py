@@ -1,6 +1,194 @@
 import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from requests_html import HTMLSession
+from utils.common.runReport import run_report
+
+# Default limits of a development key, replaced by the X-*-Rate-Limit headers once the API answers
+DEFAULT_APP_LIMITS = "20:1,100:120"
+DEFAULT_METHOD_LIMITS = {
+    "account": "1000:60",
+    "matchlist": "2000:10",
+    "match": "2000:10",
+    "timeline": "2000:10"
+}
+# Games returned by one call of the match list (most recent first)
+MATCHLIST_COUNT = 30
+
+
+def parseRateLimits(header: str) -> list:
+    """return [(count, window_seconds), ...] from a Riot header such as "20:1,100:120" """
+    limits = []
+    for part in (header or "").split(","):
+        if ":" in part:
+            count, window = part.strip().split(":", 1)
+            limits.append((int(count), int(window)))
+    return limits
+
+
+class RateLimiter:
+    """Token buckets following one Riot rate limit (app or method)
+       -each bucket holds `count` tokens and is refilled at the end of its window, like Riot's own counters
+       -acquire() blocks until every bucket has a token
+    """
+
+    def __init__(self, limits: str):
+        self.lock = threading.Lock()
+        self.buckets = []
+        self.blocked_until = 0.0
+        self.set_limits(limits)
+
+    def set_limits(self, limits: str):
+        """(re)configure the buckets, keeping the tokens already spent in a window of the same size"""
+        with self.lock:
+            now = time.monotonic()
+            self.limits = limits
+            previous = {bucket["window"]: bucket for bucket in self.buckets}
+            self.buckets = []
+            for count, window in parseRateLimits(limits):
+                bucket = previous.get(window, {"used": 0, "reset_at": now + window})
+                self.buckets.append({"count": count, "window": window,
+                                     "used": bucket["used"], "reset_at": bucket["reset_at"]})
+
+    def sync_counts(self, counts: str):
+        """align spent tokens with the X-*-Rate-Limit-Count header returned by the API"""
+        with self.lock:
+            server_counts = dict((window, count) for count, window in parseRateLimits(counts))
+            for bucket in self.buckets:
+                used = server_counts.get(bucket["window"])
+                if used is not None and used > bucket["used"]:
+                    bucket["used"] = used
+
+    def pause(self, seconds: float):
+        """block every request for the given time (Retry-After)"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        """wait until a token is available in every bucket and consume it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.blocked_until - now
+                for bucket in self.buckets:
+                    if now >= bucket["reset_at"]:
+                        bucket["used"] = 0
+                        bucket["reset_at"] = now + bucket["window"]
+                    if bucket["used"] >= bucket["count"]:
+                        wait = max(wait, bucket["reset_at"] - now)
+                if wait <= 0:
+                    for bucket in self.buckets:
+                        bucket["used"] += 1
+                    return
+            time.sleep(wait)
+
+
+class RiotClient:
+    """Shared Riot API client: concurrent requests under the app and method rate limits"""
+
+    def __init__(self, api_key: str, app_limits=DEFAULT_APP_LIMITS, max_workers=10, max_retries=3):
+        self.api_key = api_key
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.app_limiter = RateLimiter(app_limits)
+        self.method_limiters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pool = None
+
+    def executor(self) -> ThreadPoolExecutor:
+        """the worker threads of the client, kept between calls so that their sessions are reused"""
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="riot")
+            return self.pool
+
+    def shutdown(self):
+        """stop the worker threads, a later call starts new ones"""
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def session(self):
+        """one HTMLSession per worker thread, reused between calls"""
+        if not hasattr(self.local, "session"):
+            self.local.session = HTMLSession()
+        return self.local.session
+
+    def method_limiter(self, method: str):
+        with self.lock:
+            if method not in self.method_limiters:
+                self.method_limiters[method] = RateLimiter(DEFAULT_METHOD_LIMITS.get(method, ""))
+            return self.method_limiters[method]
+
+    def get(self, url: str, method: str):
+        """GET an url of the API, waiting for the limiters and retrying on 429 / 5xx"""
+        method_limiter = self.method_limiter(method)
+        response = None
+        for attempt in range(self.max_retries + 1):
+            self.app_limiter.acquire()
+            method_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session().get(url, headers={"X-Riot-Token": self.api_key})
+            except Exception:
+                run_report.record_api(method, None, time.perf_counter() - start)
+                raise
+            run_report.record_api(method, response.status_code, time.perf_counter() - start)
+            self.update_limits(response, method_limiter)
+
+            if response.status_code == 429:
+                retry_after = float(response.headers.get("Retry-After", 2 ** attempt))
+                if response.headers.get("X-Rate-Limit-Type") == "method":
+                    method_limiter.pause(retry_after)
+                else:
+                    self.app_limiter.pause(retry_after)
+            elif response.status_code >= 500:
+                time.sleep(2 ** attempt)
+            else:
+                return response
+        return response
+
+    def update_limits(self, response, method_limiter):
+        """follow the limits and counts sent back by the API"""
+        headers = response.headers
+        if headers.get("X-App-Rate-Limit", self.app_limiter.limits) != self.app_limiter.limits:
+            self.app_limiter.set_limits(headers["X-App-Rate-Limit"])
+        if headers.get("X-Method-Rate-Limit", method_limiter.limits) != method_limiter.limits:
+            method_limiter.set_limits(headers["X-Method-Rate-Limit"])
+        if headers.get("X-App-Rate-Limit-Count"):
+            self.app_limiter.sync_counts(headers["X-App-Rate-Limit-Count"])
+        if headers.get("X-Method-Rate-Limit-Count"):
+            method_limiter.sync_counts(headers["X-Method-Rate-Limit-Count"])
+
+    def map(self, function, items) -> list:
+        """run function(item) concurrently, results are returned in the items order
+           -an exception raised for one item is returned in place of its result
+        """
+        def safe_call(item):
+            try:
+                return function(item)
+            except Exception as e:
+                return e
+
+        items = list(items)
+        if not items:
+            return []
+        return list(self.executor().map(safe_call, items))
+
+
+riot_clients = {}
+riot_clients_lock = threading.Lock()
+
+
+def getClient(api_key: str) -> RiotClient:
+    """return the process-wide client of an api key"""
+    with riot_clients_lock:
+        if api_key not in riot_clients:
+            riot_clients[api_key] = RiotClient(api_key)
+        return riot_clients[api_key]
 
 
 def getPuuid(puuid_url: str, api_key: str, player) -> str:
@@ -8,43 +196,60 @@ def getPuuid(puuid_url: str, api_key: str, player) -> str:
        -PUUID_URL is a string of the api url
        -USER is a list containing gametag and tigline strings
     """
-    time.sleep(1.2)  # sleep to stay below api limits
-    session = HTMLSession()
-    response = session.get(puuid_url + player['gameName'] + '/' + player['tagLine'],
-                           headers={"X-Riot-Token": api_key})
+    status, puuid = resolvePuuid(puuid_url, api_key, player)
+    if status != 200:
+        print(f"{status}")
+    return puuid
+
+
+def resolvePuuid(puuid_url: str, api_key: str, player) -> tuple:
+    """return (status code, puuid) of a player, puuid is "" when the account was not found"""
+    response = getClient(api_key).get(puuid_url + player['gameName'] + '/' + player['tagLine'], "account")
     if response.status_code == 200:
-        return json.loads(response.text)['puuid']
-    else:
-        print(f"{response.status_code}")
-        return ""
+        return 200, json.loads(response.text)['puuid']
+    return response.status_code, ""
 
 
 def getMatchlist(matchslist_url: str, api_key: str, puuid: str, start, end):
-    """return the last 30 tourney matches from start epoch given a puuid"""
-    time.sleep(1.2)  # sleep to stay below api limits
-    session = HTMLSession()
-    response = session.get(f"{matchslist_url}{puuid}/ids?startTime={start}&endTime={end}&type=tourney&start=0&count=30",
-                           headers={"X-Riot-Token": api_key})
+    """return the last MATCHLIST_COUNT tourney matches from start epoch given a puuid, raise on an error status"""
+    response = getClient(api_key).get(
+        f"{matchslist_url}{puuid}/ids?startTime={start}&endTime={end}&type=tourney&start=0&count={MATCHLIST_COUNT}",
+        "matchlist")
+    if response.status_code != 200:
+        # the body is an error status, not a list of match ids
+        raise RuntimeError(f"matchlist of {puuid} failed with status {response.status_code}")
     return json.loads(response.text)
 
 
-def getMatchData(matchdata_url, api_key, matchid):
-    """return the match data given a match_id"""
-    time.sleep(1.2)
-    session = HTMLSession()
-    response = session.get(f"{matchdata_url}{matchid}",
-                           headers={"X-Riot-Token": api_key})
-    return json.loads(response.text)
+def getMatchData(matchdata_url, api_key, matchid, store=None):
+    """return the match data given a match_id
+       -store: optional ResponseStore checked before calling the API and filled with new responses
+    """
+    if store is not None:
+        match_data = store.get("match", matchid)
+        if match_data is not None:
+            return match_data
+    response = getClient(api_key).get(f"{matchdata_url}{matchid}", "match")
+    match_data = json.loads(response.text)
+    if store is not None and response.status_code == 200:
+        store.put("match", matchid, match_data)
+    return match_data
 
 
-def getMatchTimeLine(matchtimeline_url, api_key, matchid):
-    """return the match data given a match_id"""
-    time.sleep(1.2)
-    session = HTMLSession()
-    response = session.get(f"{matchtimeline_url}{matchid}/timeline",
-                           headers={"X-Riot-Token": api_key})
+def getMatchTimeLine(matchtimeline_url, api_key, matchid, store=None):
+    """return the match data given a match_id
+       -store: optional ResponseStore checked before calling the API and filled with new responses
+    """
+    if store is not None:
+        timeline = store.get("timeline", matchid)
+        if timeline is not None:
+            return timeline
+    response = getClient(api_key).get(f"{matchtimeline_url}{matchid}/timeline", "timeline")
     if response.status_code == 200:
-        return json.loads(response.text)
+        timeline = json.loads(response.text)
+        if store is not None:
+            store.put("timeline", matchid, timeline)
+        return timeline
     else:
         print(f"{response.status_code}")
         return ""
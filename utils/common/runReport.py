@@ -0,0 +1,193 @@
+from pymongo import monitoring
+from contextlib import contextmanager
+from datetime import datetime
+import bson
+import json
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the API latency histogram buckets, the last bucket is +Inf
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class StageReport:
+    """wall time, API calls, Mongo operations and rows processed of one stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.runs = 0
+        self.wall = 0.0
+        self.rows = {}
+        self.api = {}
+        self.mongo = {}
+
+    def record_api(self, method: str, status: int, seconds: float):
+        api = self.api.setdefault(method, {"calls": 0, "rate_limited": 0, "errors": 0, "latency_sum_s": 0.0,
+                                           "latency_buckets": [0] * (len(LATENCY_BUCKETS) + 1)})
+        api["calls"] += 1
+        api["latency_sum_s"] += seconds
+        api["latency_buckets"][next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound),
+                                    len(LATENCY_BUCKETS))] += 1
+        if status == 429:
+            api["rate_limited"] += 1
+        elif status is None or status >= 400:
+            api["errors"] += 1
+
+    def record_mongo(self, command: str, bytes_read: int, seconds: float, failed=False):
+        mongo = self.mongo.setdefault(command, {"operations": 0, "failures": 0, "bytes_read": 0, "time_s": 0.0})
+        mongo["operations"] += 1
+        mongo["failures"] += int(failed)
+        mongo["bytes_read"] += bytes_read
+        mongo["time_s"] += seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "wall_s": round(self.wall, 3),
+            "rows": self.rows,
+            "api": {method: dict(api, latency_sum_s=round(api["latency_sum_s"], 3)) for method, api in self.api.items()},
+            "mongo": {command: dict(mongo, time_s=round(mongo["time_s"], 3)) for command, mongo in self.mongo.items()}
+        }
+
+
+class RunReport:
+    """Stage-level report of a run
+       -stages nest (`update_matches/ingest`), API calls and Mongo operations of every thread go to the innermost
+        open stage, or to `other` outside of any stage
+       -nothing is recorded before start() is called (e.g. by main.py)
+       -the Mongo reply sizes are only measured with start(measure_bytes=True): a decoded reply is encoded again
+        to get its size, a full extra serialization of the largest reads (timelines), so it stays opt-in
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.stack = []
+        self.recording = False
+        self.measure_bytes = False
+
+    def start(self, measure_bytes=False):
+        """start recording the run, with the bytes of the Mongo replies when measure_bytes"""
+        with self.lock:
+            self.started_at = datetime.utcnow()
+            self.started = time.perf_counter()
+            self.recording = True
+            self.measure_bytes = measure_bytes
+
+    def current(self) -> StageReport:
+        name = "/".join(self.stack) or "other"
+        if name not in self.stages:
+            self.stages[name] = StageReport(name)
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str):
+        """time a block (or a function, as a decorator) as a stage of the run"""
+        with self.lock:
+            self.stack.append(name)
+            report = self.current()
+            report.runs += 1
+        start = time.perf_counter()
+        try:
+            yield report
+        finally:
+            with self.lock:
+                report.wall += time.perf_counter() - start
+                self.stack.pop()
+
+    def add_rows(self, kind: str, count: int):
+        with self.lock:
+            rows = self.current().rows
+            rows[kind] = rows.get(kind, 0) + int(count)
+
+    def record_api(self, method: str, status, seconds: float):
+        with self.lock:
+            self.current().record_api(method, status, seconds)
+
+    def record_mongo(self, command: str, bytes_read: int, seconds: float, failed=False):
+        with self.lock:
+            self.current().record_mongo(command, bytes_read, seconds, failed)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "started_at": self.started_at.isoformat(timespec="seconds") + "Z",
+                "elapsed_s": round(time.perf_counter() - self.started, 3),
+                "latency_buckets_s": LATENCY_BUCKETS,
+                "mongo_bytes_measured": self.measure_bytes,
+                "stages": {name: stage.to_dict() for name, stage in self.stages.items()}
+            }
+
+    def write(self, path: str):
+        """write the JSON report"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def write_prometheus(self, path: str):
+        """write the report in the Prometheus textfile format (node_exporter textfile collector)"""
+        report = self.to_dict()
+        lines = [
+            "# TYPE lolstats_stage_wall_seconds gauge",
+            "# TYPE lolstats_stage_rows gauge",
+            "# TYPE lolstats_api_calls gauge",
+            "# TYPE lolstats_api_rate_limited gauge",
+            "# TYPE lolstats_api_latency_seconds histogram",
+            "# TYPE lolstats_mongo_operations gauge",
+            "# TYPE lolstats_mongo_bytes_read gauge"
+        ]
+        for name, stage in report["stages"].items():
+            labels = f'stage="{name}"'
+            lines.append(f"lolstats_stage_wall_seconds{{{labels}}} {stage['wall_s']}")
+            for kind, count in stage["rows"].items():
+                lines.append(f'lolstats_stage_rows{{{labels},kind="{kind}"}} {count}')
+            for method, api in stage["api"].items():
+                method_labels = f'{labels},method="{method}"'
+                lines.append(f"lolstats_api_calls{{{method_labels}}} {api['calls']}")
+                lines.append(f"lolstats_api_rate_limited{{{method_labels}}} {api['rate_limited']}")
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ["+Inf"], api["latency_buckets"]):
+                    cumulative += count
+                    lines.append(f'lolstats_api_latency_seconds_bucket{{{method_labels},le="{bound}"}} {cumulative}')
+                lines.append(f"lolstats_api_latency_seconds_sum{{{method_labels}}} {api['latency_sum_s']}")
+                lines.append(f"lolstats_api_latency_seconds_count{{{method_labels}}} {api['calls']}")
+            for command, mongo in stage["mongo"].items():
+                command_labels = f'{labels},command="{command}"'
+                lines.append(f"lolstats_mongo_operations{{{command_labels}}} {mongo['operations']}")
+                if report["mongo_bytes_measured"]:
+                    lines.append(f"lolstats_mongo_bytes_read{{{command_labels}}} {mongo['bytes_read']}")
+
+        # written then renamed, the collector never reads a partial file
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.tmp", "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(f"{path}.tmp", path)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """count the Mongo commands (and the bytes of their replies when measured) in the run report"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if not run_report.recording:
+            return
+        size = 0
+        if run_report.measure_bytes:
+            reply = event.reply
+            size = len(reply.raw) if hasattr(reply, "raw") else len(bson.encode(reply))
+        run_report.record_mongo(event.command_name, size, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        if run_report.recording:
+            run_report.record_mongo(event.command_name, 0, event.duration_micros / 1e6, failed=True)
+
+
+# Process-wide report
+run_report = RunReport()
+stage = run_report.stage
+add_rows = run_report.add_rows
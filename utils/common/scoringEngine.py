@@ -0,0 +1,70 @@
+from sklearn.preprocessing import MinMaxScaler
+import numpy as np
+import pandas as pd
+
+
+class ScoringEngine:
+    """Role scoring with cached normalization
+       -each role's stat matrix is min-max normalized once, when the engine is created
+       -scoring a weight profile is then a matrix product, and many profiles are scored at once
+       -a weight profile is a dict {role: {stat: weight}} like `weighting`
+    """
+
+    def __init__(self, stats_player: pd.DataFrame, stats=None, position_column="position"):
+        """
+        :param stats_player: DataFrame containing the player statistics, one row per player/position.
+        :param stats: statistics to normalize (default: every numeric column).
+        :param position_column: column holding the role of each row.
+        """
+        self.index = stats_player.index
+        self.stats = list(stats) if stats is not None else list(stats_player.select_dtypes("number").columns)
+        self.stat_index = {stat: i for i, stat in enumerate(self.stats)}
+
+        # role -> (row positions, normalized matrix, NaN mask)
+        self.roles = {}
+        for role, rows in stats_player.groupby(position_column).indices.items():
+            normalized = MinMaxScaler().fit_transform(stats_player.iloc[rows][self.stats].astype(float))
+            self.roles[role] = (rows, np.nan_to_num(normalized), np.isnan(normalized))
+
+    def weight_matrices(self, profiles: dict) -> dict:
+        """return {role: (stats, profiles) weight matrix} of a set of profiles"""
+        matrices = {}
+        for role in self.roles:
+            matrix = np.zeros((len(self.stats), len(profiles)))
+            for column, weightings in enumerate(profiles.values()):
+                for stat, weight in weightings.get(role, {}).items():
+                    matrix[self.stat_index[stat], column] = weight
+            matrices[role] = matrix
+        return matrices
+
+    def score_profiles(self, profiles: dict) -> pd.DataFrame:
+        """return one score column (0 - 100) per profile of {profile name: weightings}
+           -roles missing from a profile score 0 before the final normalization, like scoring()
+        """
+        raw = np.zeros((len(self.index), len(profiles)))
+        for role, weights in self.weight_matrices(profiles).items():
+            rows, normalized, missing = self.roles[role]
+            scores = normalized @ weights
+            scores[(missing @ (weights != 0)) > 0] = np.nan  # a missing stat gives no score
+            raw[rows] = scores
+
+        # Normaliser le score final sur 100
+        low, high = np.nanmin(raw, axis=0), np.nanmax(raw, axis=0)
+        scale = np.where(high > low, high - low, 1.0)
+        return pd.DataFrame((raw - low) / scale * 100, index=self.index, columns=list(profiles))
+
+    def score(self, weightings: dict) -> pd.Series:
+        """return the score (0 - 100) of a single profile"""
+        return self.score_profiles({"score": weightings})["score"]
+
+
+def sensitivity_profiles(weightings: dict, factors=(0.5, 0.75, 1.25, 1.5)) -> dict:
+    """return the base profile and one profile per (role, stat, factor) with that weight multiplied by factor"""
+    profiles = {"base": weightings}
+    for role, stats in weightings.items():
+        for stat, weight in stats.items():
+            for factor in factors:
+                profile = {r: dict(s) for r, s in weightings.items()}
+                profile[role][stat] = weight * factor
+                profiles[f"{role}:{stat}x{factor}"] = profile
+    return profiles
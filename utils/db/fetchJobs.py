@@ -0,0 +1,78 @@
+from pymongo import UpdateOne
+from datetime import datetime, timedelta
+
+# Job status: pending -> done, or failed (retried after a backoff), or rejected (not a game of the tournament)
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 24 * 3600
+
+
+def job_id(kind: str, match_id: str) -> str:
+    return f"{kind}:{match_id}"
+
+
+class FetchJobs:
+    """Durable queue of the match / timeline fetches of a tournament, stored in the fetch_jobs collection"""
+
+    def __init__(self, db):
+        self.collection = db['fetch_jobs']
+
+    def enqueue(self, kind: str, match_ids: list, reset=False):
+        """create the pending jobs of match ids
+           -a done job whose result is missing from the DB (it was given again) becomes pending
+           -reset: also restart failed and rejected jobs (e.g. replay)
+        """
+        if not match_ids:
+            return
+        now = datetime.utcnow()
+        restart = ["done", "failed", "rejected"] if reset else ["done"]
+        self.collection.update_many(
+            {"_id": {"$in": [job_id(kind, match_id) for match_id in match_ids]}, "status": {"$in": restart}},
+            {"$set": {"status": "pending", "attempts": 0, "next_attempt_at": now, "updated_at": now}})
+        self.collection.bulk_write([
+            UpdateOne({"_id": job_id(kind, match_id)},
+                      {"$setOnInsert": {"kind": kind, "match_id": match_id, "status": "pending", "attempts": 0,
+                                        "next_attempt_at": now, "created_at": now, "updated_at": now}},
+                      upsert=True)
+            for match_id in match_ids
+        ], ordered=False)
+
+    def reopen_rejected(self, tournament_codes: list):
+        """restart the games rejected for their tournament code when the code was added to the list"""
+        self.collection.update_many(
+            {"status": "rejected", "reason": "tournamentCode", "tournamentCode": {"$in": tournament_codes}},
+            {"$set": {"status": "pending", "next_attempt_at": datetime.utcnow(), "updated_at": datetime.utcnow()}})
+
+    def due(self, kind: str) -> list:
+        """return the match ids of the pending jobs and of the failed jobs whose backoff is over"""
+        return [job["match_id"] for job in self.collection.find(
+            {"kind": kind, "status": {"$in": ["pending", "failed"]}, "next_attempt_at": {"$lte": datetime.utcnow()}},
+            {"match_id": 1})]
+
+    def record(self, results: list):
+        """write the results of a batch of jobs
+           -results: (status, kind, match_id, details) with details the error message of a failed job
+            or {"reason": ..., "tournamentCode": ...} for a rejected one
+        """
+        if not results:
+            return
+        now = datetime.utcnow()
+        failed = [job_id(kind, match_id) for status, kind, match_id, _ in results if status == "failed"]
+        attempts = {job["_id"]: job.get("attempts", 0)
+                    for job in self.collection.find({"_id": {"$in": failed}}, {"attempts": 1})} if failed else {}
+
+        operations = []
+        for status, kind, match_id, details in results:
+            fields = {"status": status, "updated_at": now}
+            if status == "failed":
+                tries = attempts.get(job_id(kind, match_id), 0) + 1
+                fields.update({"attempts": tries, "last_error": str(details),
+                               "next_attempt_at": now + backoff_delay(tries)})
+            elif status == "rejected":
+                fields.update(details)
+            operations.append(UpdateOne({"_id": job_id(kind, match_id)}, {"$set": fields}))
+        self.collection.bulk_write(operations, ordered=False)
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    """delay before retrying a job that failed `attempts` times: 1 min, 2 min, 4 min... up to a day"""
+    return timedelta(seconds=min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1)))
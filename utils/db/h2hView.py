@@ -0,0 +1,154 @@
+from pymongo import UpdateOne
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Objectives of match-v5 info.teams[*].objectives counted per team (kills and firsts)
+OBJECTIVES = ["champion", "tower", "inhibitor", "dragon", "riftHerald", "baron"]
+MATCH_FIELDS = {"match_id": 1, "versus": 1, "round": 1, "blue": 1, "red": 1, "info.gameDuration": 1,
+                "info.teams.teamId": 1, "info.teams.win": 1, "info.teams.objectives": 1}
+
+
+def versus_of(team1: str, team2: str) -> str:
+    """key of a team pair, the same whatever the order (as versus in update_context)"""
+    return f"{team1} vs {team2}" if team1 < team2 else f"{team2} vs {team1}"
+
+
+def h2h_increment(context: dict, match: dict):
+    """return (versus, {field: increment}, round entry) of one match, None when a team is unknown
+       -context: versus / round / blue / red of the match, match: its info.gameDuration and info.teams
+       -team_a is the first team of versus, team_b the second
+    """
+    blue, red = context["blue"], context["red"]
+    if "Unknown" in (blue, red) or blue == red:
+        return None
+    sides = {team["teamId"]: team for team in match["info"]["teams"]}
+    duration = match["info"].get("gameDuration", 0)
+
+    increment = {"games": 1, "duration_total": duration}
+    a_side = 100 if blue == min(blue, red) else 200
+    for key, side in (("a", a_side), ("b", 300 - a_side)):
+        objectives = sides.get(side, {}).get("objectives", {})
+        increment[f"{key}.wins"] = int(bool(sides.get(side, {}).get("win")))
+        increment[f"{key}.blue_games"] = int(side == 100)
+        for objective in OBJECTIVES:
+            increment[f"{key}.{objective}"] = objectives.get(objective, {}).get("kills", 0)
+            increment[f"{key}.first_{objective}"] = int(bool(objectives.get(objective, {}).get("first")))
+
+    winner = blue if sides.get(100, {}).get("win") else red
+    entry = {"round": int(context["round"]), "match_id": context["match_id"], "blue": blue, "red": red,
+             "winner": winner, "gameDuration": duration}
+    return versus_of(blue, red), increment, entry
+
+
+def empty_h2h(versus: str, blue: str, red: str) -> dict:
+    """document of a pair without games"""
+    sides = {"wins": 0, "blue_games": 0}
+    sides.update({objective: 0 for objective in OBJECTIVES})
+    sides.update({f"first_{objective}": 0 for objective in OBJECTIVES})
+    return {"_id": versus, "team_a": min(blue, red), "team_b": max(blue, red), "games": 0, "duration_total": 0,
+            "a": dict(sides), "b": dict(sides), "match_ids": [], "rounds": []}
+
+
+def update_h2h(db, contexts: list):
+    """add the matches to the h2h view, one document per team pair
+       -contexts: {match_id, versus, round, blue, red} of the matches getting their context
+       -a match already counted is skipped (match_ids), so replaying the same matches changes nothing
+    """
+    if not contexts:
+        return 0
+    matches = {match["match_id"]: match for match in
+               db['matches'].find({"match_id": {"$in": [context["match_id"] for context in contexts]}},
+                                  MATCH_FIELDS)}
+    now = datetime.utcnow()
+    updates = []
+    for context in contexts:
+        if context["match_id"] not in matches:
+            continue
+        result = h2h_increment(context, matches[context["match_id"]])
+        if result is None:
+            continue
+        versus, increment, entry = result
+        empty = empty_h2h(versus, context["blue"], context["red"])
+        # create the pair, then count the match unless it is already in match_ids
+        updates.append(UpdateOne({"_id": versus}, {"$setOnInsert": {key: value for key, value in empty.items()
+                                                                    if key != "_id"}}, upsert=True))
+        updates.append(UpdateOne({"_id": versus, "match_ids": {"$ne": context["match_id"]}},
+                                 {"$inc": increment, "$push": {"rounds": entry},
+                                  "$addToSet": {"match_ids": context["match_id"]}, "$set": {"updated_at": now}}))
+    if updates:
+        # ordered: the pair exists before its first increment
+        db['h2h'].bulk_write(updates, ordered=True)
+    return len(updates) // 2
+
+
+def build_h2h(db) -> dict:
+    """return {versus: document} of the h2h view computed from scratch from the matches with a context"""
+    documents = {}
+    for match in db['matches'].find({"round": {"$ne": None}}, MATCH_FIELDS).sort([("versus", 1), ("round", 1)]):
+        result = h2h_increment(match, match)
+        if result is None:
+            continue
+        versus, increment, entry = result
+        document = documents.setdefault(versus, empty_h2h(versus, match["blue"], match["red"]))
+        for field, value in increment.items():
+            if "." in field:
+                side, name = field.split(".")
+                document[side][name] += value
+            else:
+                document[field] += value
+        document["match_ids"].append(match["match_id"])
+        document["rounds"].append(entry)
+    return documents
+
+
+def check_h2h(db) -> list:
+    """return the pairs whose stored document differs from a rebuild (missing, extra or other counts)"""
+    expected = build_h2h(db)
+    stored = {document["_id"]: document for document in db['h2h'].find()}
+    differences = []
+    for versus in sorted(set(expected) | set(stored)):
+        if versus not in stored or versus not in expected:
+            differences.append(versus)
+            continue
+        document, reference = stored[versus], expected[versus]
+        if any(document.get(field) != reference[field] for field in ("games", "duration_total", "a", "b")) or \
+                sorted(document.get("match_ids", [])) != sorted(reference["match_ids"]):
+            differences.append(versus)
+    return differences
+
+
+def rebuild_h2h(db):
+    """replace the h2h view with one computed from scratch"""
+    documents = build_h2h(db)
+    now = datetime.utcnow()
+    db['h2h'].delete_many({})
+    if documents:
+        db['h2h'].insert_many([dict(document, updated_at=now) for document in documents.values()])
+    logger.info(f"h2h view rebuilt: {len(documents)} team pairs")
+    return len(documents)
+
+
+def h2h_lookup(db, team1: str, team2: str):
+    """head-to-head of two teams (one read by _id): winrate, average game time and objective control
+       -objective control: share of each objective taken by the team over the pair's games
+    """
+    document = db['h2h'].find_one({"_id": versus_of(team1, team2)})
+    if document is None or not document["games"]:
+        return None
+    games = document["games"]
+    summary = {"versus": document["_id"], "games": games,
+               "avg_game_duration": round(document["duration_total"] / games / 60, 1),  # minutes
+               "rounds": sorted(document["rounds"], key=lambda entry: entry["round"])}
+    for key in ("a", "b"):
+        other = "b" if key == "a" else "a"
+        sides = document[key]
+        summary[document[f"team_{key}"]] = {
+            "wins": sides["wins"], "winrate": round(sides["wins"] / games, 3), "blue_games": sides["blue_games"],
+            "objective_control": {
+                objective: round(sides[objective] / (sides[objective] + document[other][objective]), 3)
+                if sides[objective] + document[other][objective] else None for objective in OBJECTIVES},
+            "firsts": {objective: sides[f"first_{objective}"] for objective in OBJECTIVES}
+        }
+    return summary
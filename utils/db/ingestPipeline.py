@@ -0,0 +1,285 @@
+from utils.common.commonFunctions import *
+from utils.common.runReport import add_rows
+from utils.stats.frameStore import store_frames
+from utils.db.timelineStore import store_timelines
+from pymongo.errors import BulkWriteError, PyMongoError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import queue
+import time
+
+DUPLICATE_KEY = 11000
+
+
+class StageMetrics:
+    """items processed, busy time and queue depth of one pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.depth_max = 0
+        self.lock = threading.Lock()
+
+    def record(self, items=1, busy=0.0):
+        with self.lock:
+            self.items += items
+            self.busy += busy
+
+    def sample_depth(self, depth: int):
+        with self.lock:
+            self.depth_samples += 1
+            self.depth_total += depth
+            self.depth_max = max(self.depth_max, depth)
+
+    def report(self, elapsed: float) -> dict:
+        return {
+            "items": self.items,
+            "busy_s": round(self.busy, 3),
+            "throughput_per_s": round(self.items / elapsed, 2) if elapsed else 0.0,
+            "queue_depth_avg": round(self.depth_total / self.depth_samples, 2) if self.depth_samples else 0.0,
+            "queue_depth_max": self.depth_max
+        }
+
+
+class IngestPipeline:
+    """Producer/consumer ingestion of matches and timelines
+       -fetchers: a thread pool calling fetch_match / fetch_timeline, results go to a bounded queue
+       -validator: keeps the complete games of the tournament codes and requests their timelines
+       -writer: drains a bounded queue and writes by batches (insert_many / bulk_write)
+       -jobs: optional FetchJobs queue, the outcome of every fetch is recorded in it with the writes
+       -timeline_storage: "compressed" to store the raw timelines as zlib blobs (see timelineStore)
+       -executor: optional thread pool of the fetchers (e.g. the Riot client's one, to reuse its sessions)
+       -a stage stopped by an unexpected error keeps draining its input so the others finish, run() re-raises it
+    """
+
+    def __init__(self, db, fetch_match, fetch_timeline, tournament_codes: list,
+                 fetch_workers=10, queue_size=100, batch_size=50, flush_interval=1.0, jobs=None,
+                 timeline_storage=None, executor=None):
+        self.db = db
+        self.jobs = jobs
+        self.timeline_storage = timeline_storage
+        self.fetch_match = fetch_match
+        self.fetch_timeline = fetch_timeline
+        self.tournament_codes = set(tournament_codes)
+        self.fetch_workers = fetch_workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fetched = queue.Queue(maxsize=queue_size)
+        self.to_write = queue.Queue(maxsize=queue_size)
+        self.metrics = {name: StageMetrics(name) for name in ["fetch", "validate", "write"]}
+        self.lock = threading.Lock()
+        self.outstanding = 0  # fetches submitted and not yet validated
+        self.all_submitted = threading.Event()
+        self.executor = executor
+        self.own_executor = executor is None
+        self.error = None  # first unexpected error of the validator or the writer
+        self.inserted_matches = 0
+        self.stored_timelines = 0
+
+    def submit(self, kind: str, match_id: str):
+        with self.lock:
+            self.outstanding += 1
+        self.executor.submit(self.fetch, kind, match_id)
+
+    def fetch(self, kind: str, match_id: str):
+        start = time.perf_counter()
+        try:
+            payload = self.fetch_match(match_id) if kind == "match" else self.fetch_timeline(match_id)
+        except Exception as e:
+            payload = e
+        self.metrics["fetch"].record(busy=time.perf_counter() - start)
+        self.fetched.put((kind, match_id, payload))
+
+    def abort(self, stage: str, error: Exception):
+        logger.error(f"Ingestion {stage} stopped: {str(error)}")
+        with self.lock:
+            if self.error is None:
+                self.error = error
+
+    def fetched_items(self):
+        """yield the fetch results until every submitted fetch has been consumed"""
+        while True:
+            with self.lock:
+                if self.all_submitted.is_set() and self.outstanding == 0:
+                    return
+            try:
+                self.metrics["fetch"].sample_depth(self.fetched.qsize())
+                item = self.fetched.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                yield item
+            finally:
+                with self.lock:
+                    self.outstanding -= 1
+
+    def validate(self):
+        items = self.fetched_items()
+        try:
+            for kind, match_id, payload in items:
+                self.validate_item(kind, match_id, payload)
+        except Exception as e:
+            self.abort("validator", e)
+            for _ in items:  # unblock the fetchers
+                pass
+        finally:
+            self.to_write.put(None)
+
+    def validate_item(self, kind: str, match_id: str, payload):
+        start = time.perf_counter()
+        if kind == "match":
+            print(f"processing {match_id}")
+            if isinstance(payload, Exception) or payload is None:
+                logger.error(f"Could not get matchdata: {str(payload)}")
+                self.to_write.put(("job", match_id, ("failed", kind, match_id, payload)))
+            else:
+                try:
+                    payload['match_id'] = match_id
+                    payload['created_at'] = datetime.utcnow()
+                    game_status = payload['info']['endOfGameResult']
+                    tournament_code = payload['info']['tournamentCode']
+                    if tournament_code in self.tournament_codes and game_status == "GameComplete":
+                        self.to_write.put(("match", match_id, payload))
+                        self.submit("timeline", match_id)
+                    else:
+                        reason = "tournamentCode" if tournament_code not in self.tournament_codes else game_status
+                        self.to_write.put(("job", match_id, ("rejected", kind, match_id, {
+                            "reason": reason, "tournamentCode": tournament_code})))
+                except Exception as e:
+                    logger.error(f"Match not inserted: {str(e)}")
+                    self.to_write.put(("job", match_id, ("failed", kind, match_id, e)))
+        else:
+            print(f"Processing match: {match_id}")
+            if isinstance(payload, Exception):
+                logger.error(f"Failed to retrieve timeline for match_id {match_id}: {str(payload)}")
+                self.to_write.put(("job", match_id, ("failed", kind, match_id, payload)))
+            elif not payload:
+                logger.error(f"No timeline available for match_id {match_id}")
+                self.to_write.put(("job", match_id, ("failed", kind, match_id, "no timeline available")))
+            else:
+                self.to_write.put(("timeline", match_id, payload))
+
+        self.metrics["validate"].record(busy=time.perf_counter() - start)
+
+    def write(self):
+        matches, timelines, results = [], {}, []
+        last_flush = time.perf_counter()
+        item = ()
+        try:
+            while True:
+                try:
+                    self.metrics["write"].sample_depth(self.to_write.qsize())
+                    item = self.to_write.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = ()
+                if item:
+                    kind, match_id, payload = item
+                    if kind == "match":
+                        matches.append(payload)
+                    elif kind == "timeline":
+                        timelines[match_id] = payload
+                    else:
+                        results.append(payload)
+
+                pending = len(matches) + len(timelines) + len(results)
+                if pending and (item is None or pending >= self.batch_size
+                                or time.perf_counter() - last_flush >= self.flush_interval):
+                    self.flush(matches, timelines, results)
+                    matches, timelines, results = [], {}, []
+                    last_flush = time.perf_counter()
+                if item is None:
+                    break
+        except Exception as e:
+            self.abort("writer", e)
+            while item is not None:  # unblock the validator until its end marker
+                item = self.to_write.get()
+
+    def flush(self, matches: list, timelines: dict, results: list):
+        start = time.perf_counter()
+        if matches:
+            failed = {}
+            try:
+                self.inserted_matches += len(self.db['matches'].insert_many(matches, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                self.inserted_matches += e.details.get("nInserted", 0)
+                for error in e.details.get("writeErrors", []):
+                    if error.get("code") != DUPLICATE_KEY:
+                        logger.error(f"Match not inserted: {error.get('errmsg')}")
+                        failed[matches[error["index"]]['match_id']] = error.get('errmsg')
+            except PyMongoError as e:
+                # e.g. a lost connection: the whole batch is retried on the next run
+                logger.error(f"Failed to insert {len(matches)} matches: {str(e)}")
+                failed = {match['match_id']: str(e) for match in matches}
+            results += [("failed", "match", match['match_id'], failed[match['match_id']])
+                        if match['match_id'] in failed else ("done", "match", match['match_id'], None)
+                        for match in matches]
+            if self.jobs is not None:
+                # the timelines of the stored matches are fetched next, or on the next run
+                try:
+                    self.jobs.enqueue("timeline", [match['match_id'] for match in matches
+                                                   if match['match_id'] not in failed])
+                except PyMongoError as e:
+                    logger.error(f"Failed to enqueue the timelines: {str(e)}")
+
+        if timelines:
+            try:
+                store_timelines(self.db, timelines, self.timeline_storage)
+                self.stored_timelines += len(timelines)
+                # Compact per-minute frames, built once at ingest time
+                store_frames(self.db, timelines)
+                results += [("done", "timeline", match_id, None) for match_id in timelines]
+            except Exception as e:
+                logger.error(f"Failed to update timeline database: {str(e)}")
+                results += [("failed", "timeline", match_id, e) for match_id in timelines]
+
+        if self.jobs is not None:
+            try:
+                self.jobs.record(results)
+            except Exception as e:
+                logger.error(f"Failed to update fetch jobs: {str(e)}")
+
+        add_rows("matches", len(matches))
+        add_rows("timelines", len(timelines))
+        self.metrics["write"].record(items=len(matches) + len(timelines), busy=time.perf_counter() - start)
+
+    def run(self, match_ids: list, timeline_ids: list) -> dict:
+        """fetch and store new matches (and their timelines) and the missing timelines of stored matches
+           -returns the metrics of the run
+        """
+        start = time.perf_counter()
+        validator = threading.Thread(target=self.validate, name="ingest-validate")
+        writer = threading.Thread(target=self.write, name="ingest-write")
+        if self.own_executor:
+            self.executor = ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="ingest-fetch")
+        try:
+            validator.start()
+            writer.start()
+            for match_id in match_ids:
+                self.submit("match", match_id)
+            for match_id in timeline_ids:
+                self.submit("timeline", match_id)
+            self.all_submitted.set()
+            validator.join()
+        finally:
+            if self.own_executor:
+                self.executor.shutdown(wait=True)
+        writer.join()
+        if self.error is not None:
+            raise self.error
+
+        elapsed = time.perf_counter() - start
+        report = {
+            "elapsed_s": round(elapsed, 3),
+            "matches_inserted": self.inserted_matches,
+            "timelines_stored": self.stored_timelines,
+            "stages": {name: metrics.report(elapsed) for name, metrics in self.metrics.items()}
+        }
+        logger.info(f"Ingestion done in {report['elapsed_s']}s: {self.inserted_matches} matches, "
+                    f"{self.stored_timelines} timelines")
+        for name, stage in report["stages"].items():
+            logger.info(f"  {name}: {stage['items']} items, {stage['throughput_per_s']}/s, "
+                        f"queue depth avg {stage['queue_depth_avg']} max {stage['queue_depth_max']}")
+        return report
@@ -0,0 +1,74 @@
+from utils.common.commonFunctions import *
+from utils.common.riotApi import getClient
+from utils.db.updateDB import update_matches
+from utils.stats.prepareStats import generate_player_match_stats
+import gc
+import time
+
+# Polling intervals in seconds: tight during the START_TIMESTAMP - END_TIMESTAMP window, loose outside of it
+LIVE_INTERVAL = 120
+IDLE_INTERVAL = 1800
+# Games finishing after END_TIMESTAMP are still collected during this delay, then the daemon stops
+END_GRACE = 3600
+
+
+def next_poll_delay(now: float, start: float, end: float, live_interval=LIVE_INTERVAL, idle_interval=IDLE_INTERVAL):
+    """return the seconds to wait before the next poll, None once the tournament window (and its grace) is over"""
+    if now > end + END_GRACE:
+        return None
+    if start <= now <= end + END_GRACE:
+        return live_interval
+    # before the window: wake up at its start at the latest
+    return min(idle_interval, max(start - now, 0))
+
+
+def run_cycle(tournament: str, export=True, server_side=False) -> dict:
+    """ingest the new games, then refresh the derived stats and the export if matches were materialized"""
+    inserted = update_matches(tournament)
+    materialized = generate_player_match_stats(tournament)
+    if export and materialized:
+        from utils.stats.playerStats import generate_players_stats
+        generate_players_stats(tournament, server_side=server_side)
+    return {"inserted": inserted, "materialized": materialized}
+
+
+def run_daemon(tournament: str, live_interval=LIVE_INTERVAL, idle_interval=IDLE_INTERVAL, export=True,
+               server_side=False, max_cycles=None, clock=time.time, sleep=time.sleep, on_cycle=None):
+    """poll and ingest the tournament games until the end of its window
+       -API calls go through the process-wide rate-limited client, so the limits hold across cycles and its
+        worker threads (with their HTTP sessions) are reused by every cycle, they are stopped with the daemon
+       -a cycle keeps nothing once finished: memory stays bounded over a whole match day
+       -max_cycles / clock / sleep allow running it against a stand-in of the API in tests
+       -on_cycle: called after each polling cycle (e.g. to refresh the run report)
+    """
+    start = int(getFileValue("START_TIMESTAMP", f"tournaments/{tournament}/.config"))
+    end = int(getFileValue("END_TIMESTAMP", f"tournaments/{tournament}/.config"))
+    logger.info(f"Daemon started for {tournament}")
+
+    cycles = 0
+    try:
+        while max_cycles is None or cycles < max_cycles:
+            delay = next_poll_delay(clock(), start, end, live_interval, idle_interval)
+            if delay is None:
+                logger.info("Tournament window is over, daemon stopped")
+                break
+
+            cycle_start = clock()
+            if start <= cycle_start <= end + END_GRACE:
+                try:
+                    result = run_cycle(tournament, export=export, server_side=server_side)
+                    logger.info(f"Cycle {cycles + 1}: {result['inserted']} new matches, "
+                                f"{result['materialized']} matches added to the stats")
+                except Exception as e:
+                    logger.error(f"Cycle {cycles + 1} failed: {str(e)}")
+                if on_cycle is not None:
+                    on_cycle()
+                gc.collect()
+                delay = max(delay - (clock() - cycle_start), 0)
+            cycles += 1
+            sleep(delay)
+    except KeyboardInterrupt:
+        logger.info("Daemon stopped")
+    finally:
+        getClient(getFileValue("API_KEY", ".env")).shutdown()
+    return cycles
@@ -0,0 +1,69 @@
+from pymongo import ASCENDING, IndexModel, DeleteMany
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def deduplicate(collection, keys: list):
+    """delete the documents sharing the same keys, keeping the first inserted one"""
+    duplicates = collection.aggregate([
+        {"$group": {"_id": {key.replace(".", "_"): f"${key}" for key in keys},
+                    "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    deletes = [DeleteMany({"_id": {"$in": sorted(group["ids"])[1:]}}) for group in duplicates]
+    if deletes:
+        result = collection.bulk_write(deletes, ordered=False)
+        logger.info(f"{result.deleted_count} duplicates removed from {collection.name}")
+
+
+def migration_1(db):
+    """indexes of the hot lookups, unique keys after removing duplicates"""
+    for collection_name in ["matches", "timelines", "frame_stats"]:
+        deduplicate(db[collection_name], ["match_id"])
+        db[collection_name].create_indexes([IndexModel([("match_id", ASCENDING)], unique=True)])
+
+    deduplicate(db['stats_players'], ["match_id", "name"])
+    db['stats_players'].create_indexes([
+        IndexModel([("match_id", ASCENDING), ("name", ASCENDING)], unique=True),
+        IndexModel([("name", ASCENDING), ("teamPosition", ASCENDING)])
+    ])
+
+    # puuid is "" until resolved and players may be registered twice, so these are not unique
+    db['players'].create_indexes([
+        IndexModel([("puuid", ASCENDING)]),
+        IndexModel([("gameName", ASCENDING), ("tagLine", ASCENDING)])
+    ])
+
+
+def migration_2(db):
+    """fetch job queue: due jobs lookup"""
+    db['fetch_jobs'].create_indexes([
+        IndexModel([("kind", ASCENDING), ("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+    ])
+
+
+def migration_3(db):
+    """timeline event features: one document per match"""
+    deduplicate(db['timeline_features'], ["match_id"])
+    db['timeline_features'].create_indexes([IndexModel([("match_id", ASCENDING)], unique=True)])
+
+
+# Schema migrations, applied in order; append new ones at the end
+MIGRATIONS = [migration_1, migration_2, migration_3]
+
+
+def bootstrap_schema(db):
+    """bring the tournament database to the latest schema version (stored in the meta collection)"""
+    schema = db['meta'].find_one({"_id": "schema"}) or {}
+    version = schema.get("version", 0)
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info(f"Migrating database {db.name} to schema version {number}")
+        migration(db)
+        db['meta'].update_one(
+            {"_id": "schema"},
+            {"$set": {"version": number, "migrated_at": datetime.utcnow()}},
+            upsert=True
+        )
@@ -0,0 +1,83 @@
+from utils.common.commonFunctions import *
+from utils.common.riotApi import MATCHLIST_COUNT
+
+
+def plan_match_polling(db, tournament_codes: list) -> dict:
+    """choose the roster members of each team whose match list is polled
+       -the representative is the player who played the most stored tournament games of the team
+       -the whole roster is polled for a team without stored games (nothing tells who plays) or whose stored
+        lineups changed (a substitute played, the representative may sit out the next games)
+       -returns {team: {"representative": player, "roster": [players], "poll_roster": bool,
+                        "games": {match_id: set of roster puuids}, "created": {match_id: gameCreation}}}
+    """
+    players_with_puuid = list(db['players'].find(
+        {"puuid": {"$exists": True, "$ne": ""}},
+        {"puuid": 1, "gameName": 1, "tagLine": 1, "team": 1}))
+    puuid_to_player = {player['puuid']: player for player in players_with_puuid}
+
+    plan = {}
+    for player in players_with_puuid:
+        team = player.get('team') or f"{player.get('gameName')}#{player.get('tagLine')}"  # players without team
+        plan.setdefault(team, {"representative": None, "roster": [], "poll_roster": False, "games": {},
+                               "created": {}})["roster"].append(player)
+
+    # Games of each team, with the roster members who played them
+    stored_matches = db['matches'].find(
+        {"info.tournamentCode": {"$in": tournament_codes}},
+        {"match_id": 1, "metadata.participants": 1, "info.gameCreation": 1})
+    for match in stored_matches:
+        participants = match["metadata"]["participants"]
+        for side in (participants[:5], participants[5:]):
+            team = get_team(side, puuid_to_player)
+            if isinstance(team, str) and team in plan:
+                plan[team]["games"][match["match_id"]] = {
+                    puuid for puuid in side if puuid_to_player.get(puuid, {}).get('team') == team}
+                plan[team]["created"][match["match_id"]] = match["info"].get("gameCreation", 0)
+
+    for team, team_plan in plan.items():
+        appearances = {player['puuid']: 0 for player in team_plan["roster"]}
+        for puuids in team_plan["games"].values():
+            for puuid in puuids:
+                appearances[puuid] += 1
+        team_plan["representative"] = max(team_plan["roster"], key=lambda p: appearances[p['puuid']])
+
+        lineups = {frozenset(puuids) for puuids in team_plan["games"].values()}
+        team_plan["poll_roster"] = len(team_plan["roster"]) > 1 and (not lineups or len(lineups) > 1)
+
+    return plan
+
+
+def players_to_poll(plan: dict) -> list:
+    """return the players polled first: the representative of each team, the whole roster where poll_roster"""
+    players = []
+    for team_plan in plan.values():
+        players += team_plan["roster"] if team_plan["poll_roster"] else [team_plan["representative"]]
+    return players
+
+
+def fallback_players(plan: dict, match_lists: dict) -> list:
+    """return the other roster members to poll for teams whose coverage looks incomplete
+       -match_lists: {puuid: [match_id, ...]} of the polled representatives
+       -coverage is incomplete when the representative's list misses a stored game of the team it should contain
+        or when the representative's list could not be retrieved
+       -a full list (MATCHLIST_COUNT ids) only covers the games since the oldest one it contains
+    """
+    players = []
+    for team, team_plan in plan.items():
+        if team_plan["poll_roster"]:
+            continue  # already polled
+        representative = team_plan["representative"]
+        match_ids = match_lists.get(representative['puuid'])
+        if isinstance(match_ids, list):
+            created = team_plan["created"]
+            expected = set(team_plan["games"])
+            if len(match_ids) >= MATCHLIST_COUNT:
+                listed = [created[match_id] for match_id in match_ids if match_id in created]
+                expected = {match_id for match_id, timestamp in created.items()
+                            if listed and timestamp >= min(listed)}
+            missed_games = expected - set(match_ids)
+            if not missed_games:
+                continue
+            logger.info(f"{team}: {len(missed_games)} games missing from {representative['gameName']}'s match list")
+        players += [player for player in team_plan["roster"] if player['puuid'] != representative['puuid']]
+    return players
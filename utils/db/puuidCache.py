@@ -0,0 +1,32 @@
+from pymongo import UpdateOne
+from datetime import datetime, timedelta
+
+# An account not found (404) is not asked again before this delay, it may be created or renamed meanwhile
+NEGATIVE_TTL = timedelta(days=1)
+
+
+def riot_id(player) -> str:
+    """cache key of a player: gameName#tagLine, case-insensitive like Riot IDs"""
+    return f"{player.get('gameName', '')}#{player.get('tagLine', '')}".lower()
+
+
+def cached_puuids(db, riot_ids: list) -> dict:
+    """return {riot id: puuid} of the cached accounts, puuid is None for an account recently not found"""
+    now = datetime.utcnow()
+    cached = {}
+    for entry in db['puuid_cache'].find({"_id": {"$in": list(riot_ids)}}):
+        if entry.get("puuid"):
+            cached[entry["_id"]] = entry["puuid"]
+        elif now - entry["checked_at"] < NEGATIVE_TTL:
+            cached[entry["_id"]] = None
+    return cached
+
+
+def cache_puuids(db, results: dict):
+    """store {riot id: puuid} in the cache, an empty puuid is a negative entry"""
+    now = datetime.utcnow()
+    if results:
+        db['puuid_cache'].bulk_write([
+            UpdateOne({"_id": key}, {"$set": {"puuid": puuid or None, "checked_at": now}}, upsert=True)
+            for key, puuid in results.items()
+        ], ordered=False)
@@ -0,0 +1,75 @@
+from pymongo import UpdateOne
+from bson.binary import Binary
+import gridfs
+import json
+import zlib
+
+# TIMELINE_STORAGE=compressed (.env) keeps each raw timeline as a zlib blob next to a few queryable fields,
+# the default "document" mode stores the expanded timeline
+COMPRESSED = "compressed"
+COMPRESSION_LEVEL = 6
+GRIDFS_THRESHOLD = 15 * 1024 * 1024  # blobs above this size go to GridFS, a document is limited to 16 MB
+GRIDFS_BUCKET = "timeline_blobs"
+BLOB_FIELDS = ["compression", "data", "gridfs_id"]
+
+
+def timeline_fields(timeline: dict) -> dict:
+    """small fields kept queryable in compressed mode"""
+    info = timeline.get("info", {})
+    return {
+        "metadata": timeline.get("metadata", {}),
+        "info": {"gameId": info.get("gameId"), "frameInterval": info.get("frameInterval"),
+                 "endOfGameResult": info.get("endOfGameResult")},
+        "frame_count": len(info.get("frames", []))
+    }
+
+
+def store_timelines(db, timelines: dict, storage=None):
+    """upsert the timelines of {match_id: timeline} in the timelines collection"""
+    if not timelines:
+        return
+    # GridFS blobs of the previous versions, deleted once replaced
+    replaced = [document["gridfs_id"] for document in db['timelines'].find(
+        {"match_id": {"$in": list(timelines)}, "gridfs_id": {"$exists": True}}, {"gridfs_id": 1})]
+    updates = []
+    for match_id, timeline in timelines.items():
+        if storage == COMPRESSED:
+            blob = zlib.compress(json.dumps(timeline, separators=(",", ":")).encode(), COMPRESSION_LEVEL)
+            document = dict(timeline_fields(timeline), compression="zlib")
+            if len(blob) > GRIDFS_THRESHOLD:
+                document["gridfs_id"] = gridfs.GridFS(db, GRIDFS_BUCKET).put(blob, filename=match_id)
+                unset = {"data": ""}
+            else:
+                document["data"] = Binary(blob)
+                unset = {"gridfs_id": ""}
+        else:
+            # the expanded timeline replaces the blob of a timeline stored compressed before
+            document = {key: value for key, value in timeline.items() if key != "_id"}
+            unset = {field: "" for field in BLOB_FIELDS + ["frame_count"]}
+        updates.append(UpdateOne({"match_id": match_id}, {"$set": document, "$unset": unset}, upsert=True))
+    db['timelines'].bulk_write(updates, ordered=False)
+    for gridfs_id in replaced:
+        gridfs.GridFS(db, GRIDFS_BUCKET).delete(gridfs_id)
+
+
+def expand_timeline(db, document: dict) -> dict:
+    """return the full timeline of a timelines document, decompressing its blob if needed"""
+    if "compression" not in document:
+        return document
+    blob = document["data"] if "data" in document else \
+        gridfs.GridFS(db, GRIDFS_BUCKET).get(document["gridfs_id"]).read()
+    timeline = json.loads(zlib.decompress(blob))
+    timeline.update({key: value for key, value in document.items()
+                     if key not in BLOB_FIELDS + ["metadata", "info", "frame_count"]})
+    return timeline
+
+
+def find_timelines(db, query: dict, projection=None, batch_size=0):
+    """yield the full timelines matching query, one at a time
+       -projection only limits the expanded documents, a compressed timeline is decompressed whole
+       -batch_size: documents per server round trip (0: the server default, up to 16 MB of timelines)
+    """
+    if projection is not None:
+        projection = dict(projection, **{field: 1 for field in BLOB_FIELDS})
+    for document in db['timelines'].find(query, projection).batch_size(batch_size):
+        yield expand_timeline(db, document)
@@ -1,113 +1,156 @@
 from utils.common.commonFunctions import *
+from utils.common.runReport import stage, add_rows
 from utils.common.riotApi import *
+from utils.common.responseStore import getResponseStore
+from utils.db.pollingPlanner import plan_match_polling, players_to_poll, fallback_players
+from utils.db.ingestPipeline import IngestPipeline
+from utils.db.fetchJobs import FetchJobs
+from utils.db.puuidCache import riot_id, cached_puuids, cache_puuids
+from utils.db.h2hView import update_h2h
 from pymongo import UpdateOne
 from datetime import datetime
 import pandas as pd
+import numpy as np
 
 
+@stage("puuid")
 def update_puuid(players_collection):
-    """check for players missing puuid and add it"""
+    """check for players missing puuid and add it
+       -puuids are read from the puuid_cache collection first, accounts not found (404) are cached too
+       -the other players are resolved concurrently and written with a single bulk_write
+    """
     api_key = getFileValue("API_KEY", ".env")
     puuid_url = getFileValue("PUUID_URL", ".env")
+    db = players_collection.database
 
     # Find all players without PUUID
-    players_without_puuid = players_collection.find({
+    players_without_puuid = list(players_collection.find({
         "$or": [
             {"puuid": {"$exists": False}},
             {"puuid": None},
             {"puuid": ""}
         ]
-    })
+    }, {"gameName": 1, "tagLine": 1, "team": 1}))
+    if not players_without_puuid:
+        return
 
-    # Check whether the player already exists (based on gameName and tagLine)
+    puuids = cached_puuids(db, {riot_id(player) for player in players_without_puuid})
+    to_resolve = {}
     for player in players_without_puuid:
-        print(f"Processing player: {player.get('gameName', 'Unknown')}#{player.get('tagLine', 'Unknown')}")
-
-        # Keep the original _id
-        player_id = player['_id']
-
-        update_player = {
+        if riot_id(player) not in puuids:
+            to_resolve.setdefault(riot_id(player), player)
+    logger.info(f"{len(players_without_puuid)} players without puuid, {len(to_resolve)} to ask to the API")
+
+    # Get PUUIDs from Riot API, concurrently within the rate limits
+    responses = getClient(api_key).map(lambda player: resolvePuuid(puuid_url, api_key, player),
+                                       to_resolve.values())
+    resolved = {}
+    for (key, player), response in zip(to_resolve.items(), responses):
+        if isinstance(response, Exception):
+            logger.error(f"Error when retrieving puuid: {str(response)}")
+            continue
+        status, puuid = response
+        if status == 200 or status == 404:
+            resolved[key] = puuid
+        else:
+            logger.error(f"Error when retrieving puuid of {player.get('gameName')}#{player.get('tagLine')}: {status}")
+    cache_puuids(db, resolved)
+    add_rows("players", len(players_without_puuid))
+    puuids.update(resolved)
+
+    updates, new_puuids = [], []
+    for player in players_without_puuid:
+        puuid = puuids.get(riot_id(player))
+        if not puuid:
+            logger.warning(f"No account found for {player.get('gameName', 'Unknown')}#{player.get('tagLine', 'Unknown')}")
+            continue
+        updates.append(UpdateOne({"_id": player['_id']}, {"$set": {
             "gameName": player.get('gameName', 'Unknown'),
             "tagLine": player.get('tagLine', 'Unknown'),
             "team": player.get('team', 'Unknown'),
+            "puuid": puuid,
             "last_updated": datetime.utcnow()
-        }
+        }}))
+        new_puuids.append(puuid)
 
+    if updates:
         try:
-            # Get PUUID from Riot API
-            update_player['puuid'] = getPuuid(puuid_url, api_key, update_player)
-        except Exception as e:
-            logger.error(f"Error when retrieving puuid: {str(e)}")
-            continue
-
-        # Update insertion method
-        try:
-            # Update the existing document
-            players_collection.update_one(
-                {"_id": player_id},
-                {
-                    "$set": update_player
-                }
-            )
-
+            result = players_collection.bulk_write(updates, ordered=False)
+            logger.info(f"{result.modified_count} puuids updated")
+            # matches already materialized without these players: their stats_players rows are added next refresh
+            reopened = db['matches'].update_many(
+                {"metadata.participants": {"$in": new_puuids}, "stats_at": {"$exists": True}},
+                {"$unset": {"stats_at": ""}})
+            if reopened.modified_count:
+                logger.info(f"{reopened.modified_count} matches of the new players to materialize again")
         except Exception as e:
             logger.error(f"Fail when updating data: {str(e)}")
 
 
+@stage("context")
 def update_context(db):
-    puuid_to_playerdata = {p["puuid"]: p for p in db['players'].find()}
-    matches = list(db['matches'].find({}, {"match_id": 1, "info.gameCreation": 1, "metadata.participants": 1}))
-    df = pd.DataFrame([
-        {
-            "match_id": match["match_id"],
-            "participants1": match["metadata"]["participants"][:4],
-            "participants2": match["metadata"]["participants"][5:],
-            "gamedate": match["info"]["gameCreation"]
-        }
-        for match in matches
-    ])
-    df['team1'] = df['participants1'].apply(lambda x: get_team(x, puuid_to_playerdata))
-    df['team2'] = df['participants2'].apply(lambda x: get_team(x, puuid_to_playerdata))
-    df['gameCreation_dt'] = pd.to_datetime(df['gamedate'], unit='ms')  # Convert gameCreation to datetime format
-    df['date'] = df['gameCreation_dt'].dt.strftime('%Y-%m-%d')  # Create the ‘date’ field in YYYY-MM-DD format
-    df['time'] = df['gameCreation_dt'].dt.strftime('%H:%M:%S')  # Create the ‘time’ field in HH:MM:SS format
-    df['game_dt'] = df['gameCreation_dt'].dt.strftime('%Y-%m-%d %H:%M:%S')
-    df['versus'] = df.apply(
-        lambda row:
-        f"{row['team1']} vs {row['team2']}" if row['team1'] < row['team2'] else f"{row['team2']} vs {row['team1']}",
-        axis=1)
-    df = df.sort_values(by=['versus', 'date', 'time']).reset_index(drop=True)
+    """set game_dt / versus / round / blue / red on the matches and timelines that have no context yet
+       -the new matches are added to the h2h view at the same time
+    """
+    puuid_to_team = {p["puuid"]: p.get("team") for p in
+                     db['players'].find({"puuid": {"$exists": True, "$ne": ""}}, {"puuid": 1, "team": 1})}
+    matches = list(db['matches'].find({}, {"match_id": 1, "round": 1, "info.gameCreation": 1,
+                                           "metadata.participants": 1}))
+    if not matches:
+        return
+
+    df = pd.DataFrame({
+        "match_id": [match["match_id"] for match in matches],
+        "gamedate": [match["info"]["gameCreation"] for match in matches],
+        "has_context": [match.get("round") is not None for match in matches]
+    })
+
+    # one row per participant, the first 5 participants are on the blue side
+    participants = pd.DataFrame(
+        [(match["match_id"], index < 5, puuid)
+         for match in matches for index, puuid in enumerate(match["metadata"]["participants"])],
+        columns=["match_id", "blue_side", "puuid"])
+    participants["team"] = participants["puuid"].map(puuid_to_team)
+
+    # most frequent team of each side
+    sides = participants.dropna(subset=["team"]).groupby(["match_id", "blue_side", "team"]).size()
+    sides = sides.reset_index(name="count").sort_values(["match_id", "blue_side", "count", "team"],
+                                                        ascending=[True, True, False, True])
+    sides = sides.drop_duplicates(subset=["match_id", "blue_side"]).pivot(
+        index="match_id", columns="blue_side", values="team")
+    df['team1'] = df['match_id'].map(sides.get(True, pd.Series(dtype=object))).fillna("Unknown")
+    df['team2'] = df['match_id'].map(sides.get(False, pd.Series(dtype=object))).fillna("Unknown")
+
+    df['game_dt'] = pd.to_datetime(df['gamedate'], unit='ms').dt.strftime('%Y-%m-%d %H:%M:%S')
+    df['versus'] = np.where(df['team1'] < df['team2'],
+                            df['team1'] + " vs " + df['team2'],
+                            df['team2'] + " vs " + df['team1'])
+    df = df.sort_values(by=['versus', 'gamedate']).reset_index(drop=True)
     df['round'] = df.groupby(['versus']).cumcount() + 1  # identify the game number
     df['blue'] = df['team1']
     df['red'] = df['team2']
-    df.drop(columns=['participants1', 'participants2', 'gameCreation_dt', 'team1', 'team2'], inplace=True)
-
-    for match in db['matches'].find():
-        match_id = match["metadata"]["matchId"]
-        round_number = match.get("round", None)
-
-        context = {"game_dt": str(df.query('match_id == @match_id')['game_dt'].iloc[0]),
-                   "versus": str(df.query('match_id == @match_id')['versus'].iloc[0]),
-                   "round": int(df.query('match_id == @match_id')['round'].iloc[0]),
-                   "blue": str(df.query('match_id == @match_id')['blue'].iloc[0]),
-                   "red": str(df.query('match_id == @match_id')['red'].iloc[0])
-                   }
-
-        if round_number is None:
-            db['matches'].update_one(
-                {"match_id": match_id},
-                {
-                    "$set": context
-                }
-            )
-            db['timelines'].update_one(
-                {"match_id": match_id},
-                {
-                    "$set": context
-                }
-            )
 
+    df = df[~df['has_context']]
+    if df.empty:
+        return
+
+    # head-to-head view first: counting a match twice is a no-op, so a failure below is retried safely
+    update_h2h(db, df[['match_id', 'versus', 'round', 'blue', 'red']].to_dict("records"))
+
+    updates = [
+        UpdateOne({"match_id": match_id},
+                  {"$set": {"game_dt": game_dt, "versus": versus, "round": int(round_number),
+                            "blue": blue, "red": red}})
+        for match_id, game_dt, versus, round_number, blue, red in
+        zip(df['match_id'], df['game_dt'], df['versus'], df['round'], df['blue'], df['red'])
+    ]
+    result = db['matches'].bulk_write(updates, ordered=False)
+    db['timelines'].bulk_write(updates, ordered=False)
+    add_rows("matches", len(updates))
+    logger.info(f"Context set on {result.modified_count} matches")
 
+
+@stage("update_players")
 def update_players(tournament: str):
     logger.info("Players Update...")
 
@@ -149,8 +192,16 @@ def update_players(tournament: str):
     # TODO : leading 0 in players.csv
 
 
-def update_matches(tournament: str):
-    logger.info("Update matches...")
+@stage("update_matches")
+def update_matches(tournament: str, replay=False):
+    """fetch the new tournament matches and their timelines
+       -raw API responses are kept in the tournament response store and read from it first
+       -replay: rebuild the DB from the response store only, without calling the API
+       -every fetch is a job of the fetch_jobs collection: an interrupted run resumes where it stopped
+        and failed fetches are retried with an exponential backoff on the next runs
+       -returns the number of matches inserted
+    """
+    logger.info("Replay matches from the response store..." if replay else "Update matches...")
 
     api_key = getFileValue("API_KEY", ".env")
     matchslist_url = getFileValue("MATCHSLIST_URL", ".env")
@@ -158,6 +209,7 @@ def update_matches(tournament: str):
     matchtimeline_url = getFileValue("MATCHTIMELINE_URL", ".env")
     start_timestamp = getFileValue("START_TIMESTAMP", f"tournaments/{tournament}/.config")
     end_timestamp = getFileValue("END_TIMESTAMP", f"tournaments/{tournament}/.config")
+    timeline_storage = getFileValue("TIMELINE_STORAGE", ".env")
 
     db = logToDB(tournament)
     players_collection = db['players']
@@ -165,79 +217,94 @@ def update_matches(tournament: str):
     timelines_collection = db['timelines']
 
     tournament_codes = get_tournament_codes(tournament)
+    store = getResponseStore(tournament)
+    client = getClient(api_key)
+    jobs = FetchJobs(db)
+
+    if replay:
+        def fetch_match(match_id):
+            return store.get("match", match_id)
+
+        def fetch_timeline(match_id):
+            return store.get("timeline", match_id) or ""
+    else:
+        def fetch_match(match_id):
+            return getMatchData(matchdata_url, api_key, match_id, store)
+
+        def fetch_timeline(match_id):
+            return getMatchTimeLine(matchtimeline_url, api_key, match_id, store)
 
     # Update Matchs data
-    try:
-        players_with_puuid = players_collection.find({
-            "$and": [
-                {"puuid": {"$exists": True}},
-                {"puuid": {"$ne": ""}}
-            ]
-        })
-        for player in players_with_puuid:
-            print(f"processing {player['gameName']}")
-            match_ids = getMatchlist(matchslist_url, api_key, player['puuid'], start_timestamp, end_timestamp)
-            for match_id in match_ids:
-                if matches_collection.count_documents({"match_id": match_id}) == 0:
-                    print(f"processing {match_id}")
-                    try:
-                        match_data = getMatchData(matchdata_url, api_key, match_id)
-                    except Exception as e:
-                        logger.error(f"Could not get matchdata: {str(e)}")
-                        break
-                    try:
-                        match_data['match_id'] = match_id
-                        match_data['created_at'] = datetime.utcnow()
-                        game_status = match_data['info']['endOfGameResult']
-                        if match_data['info']['tournamentCode'] in tournament_codes and game_status == "GameComplete":
-                            matches_collection.insert_one(match_data)
-                    except Exception as e:
-                        logger.error(f"Match not inserted: {str(e)}")
-
-    except Exception as e:
-        logger.error(f"General Fail: {str(e)}")
-
-    # Update timeline data
-    try:
-        time.sleep(0.5)
-        # Get all match_id of timelines
-        existing_timeline_ids = {
-            timeline['match_id'] for timeline in
-            timelines_collection.find({"match_id": {"$exists": True, "$ne": ""}}, {"match_id": 1})}
-
-        # getting matchs id in matchs collection that are not yet in timelines
-        matchs_without_timeline = matches_collection.find({
-            "$and": [
-                {"match_id": {"$exists": True, "$ne": ""}},
-                {"match_id": {"$nin": list(existing_timeline_ids)}}
-            ]
-        })
-
-        for match in matchs_without_timeline:
-            match_id = match['match_id']
-            print(f"Processing match: {match_id}")
-
-            try:
-                # Retrieve timeline data for the match
-                timeline = getMatchTimeLine(matchtimeline_url, api_key, match_id)
-
-                # Update or insert the timeline data in timelines collection
-                try:
-                    update_result = timelines_collection.update_one(
-                        {"match_id": match_id},
-                        {"$set": timeline},
-                        upsert=True  # Insert if the document doesn't exist
-                    )
-                    if not update_result.upserted_id:
-                        logger.info(f"Updated existing timeline for match_id: {match_id}")
-
-                except Exception as e:
-                    logger.error(f"Failed to update timeline database for match_id {match_id}: {str(e)}")
-
-            except Exception as e:
-                logger.error(f"Failed to retrieve timeline for match_id {match_id}: {str(e)}")
-
-    except Exception as e:
-        logger.error(f"General failure in updating timelines: {str(e)}")
+    with stage("discovery"):
+        try:
+            if replay:
+                sources = [("response store", store.ids("match"))]
+            else:
+                def poll(players):
+                    match_lists = client.map(
+                        lambda player: getMatchlist(matchslist_url, api_key, player['puuid'], start_timestamp,
+                                                    end_timestamp),
+                        players)
+                    return [(player, match_ids) for player, match_ids in zip(players, match_lists)]
+
+                # Poll one representative per team (the whole roster of new or rotating teams),
+                # then the rest of the roster where coverage looks incomplete
+                plan = plan_match_polling(db, tournament_codes)
+                polled = poll(players_to_poll(plan))
+                polled += poll(fallback_players(plan, {player['puuid']: match_ids for player, match_ids in polled}))
+                logger.info(f"{len(polled)} match lists polled for {len(plan)} teams")
+                sources = [(player['gameName'], match_ids) for player, match_ids in polled]
+
+            # Union of the match ids of every source, each id kept once
+            discovered_ids = {}
+            for source, match_ids in sources:
+                print(f"processing {source}")
+                if not isinstance(match_ids, list):
+                    logger.error(f"Could not get matchlist: {str(match_ids)}")
+                    continue
+                discovered_ids.update(dict.fromkeys(match_ids))
+
+            # Ids already stored, found with a single query
+            stored_ids = {
+                match['match_id'] for match in
+                matches_collection.find({"match_id": {"$in": list(discovered_ids)}}, {"match_id": 1})}
+            new_match_ids = [match_id for match_id in discovered_ids if match_id not in stored_ids]
+            logger.info(f"{len(discovered_ids)} matches found, {len(new_match_ids)} new")
+            jobs.enqueue("match", new_match_ids, reset=replay)
+
+        except Exception as e:
+            logger.error(f"General Fail: {str(e)}")
+
+    # Fetch, validate and store the new matches and the missing timelines
+    inserted = 0
+    with stage("ingest"):
+        try:
+            # Get all match_id of timelines
+            existing_timeline_ids = {
+                timeline['match_id'] for timeline in
+                timelines_collection.find({"match_id": {"$exists": True, "$ne": ""}}, {"match_id": 1})}
+
+            # getting matchs id in matchs collection that are not yet in timelines
+            matchs_without_timeline = matches_collection.find({
+                "$and": [
+                    {"match_id": {"$exists": True, "$ne": ""}},
+                    {"match_id": {"$nin": list(existing_timeline_ids)}}
+                ]
+            }, {"match_id": 1})
+            jobs.enqueue("timeline", [match['match_id'] for match in matchs_without_timeline], reset=replay)
+            jobs.reopen_rejected(tournament_codes)
+
+            # Pending jobs, including the ones of an interrupted run, and failed jobs whose backoff is over
+            match_ids, timeline_ids = jobs.due("match"), jobs.due("timeline")
+            logger.info(f"{len(match_ids)} match and {len(timeline_ids)} timeline fetches to do")
+
+            pipeline = IngestPipeline(db, fetch_match, fetch_timeline, tournament_codes,
+                                      fetch_workers=client.max_workers, jobs=jobs,
+                                      timeline_storage=timeline_storage, executor=client.executor())
+            inserted = pipeline.run(match_ids, timeline_ids)["matches_inserted"]
+
+        except Exception as e:
+            logger.error(f"General failure in updating matches and timelines: {str(e)}")
 
     update_context(db)
+    return inserted
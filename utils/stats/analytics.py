@@ -0,0 +1,127 @@
+from utils.common.commonFunctions import *
+from utils.common.runReport import stage, add_rows
+from utils.stats.playerStats import aggregate_players_stats, aggregate_players_stats_server, export_players_stats
+import numpy as np
+import pandas as pd
+
+REPORTS = ["players", "pool", "champions", "h2h"]
+
+
+def kda(kills, deaths, assists):
+    """(kills + assists) / deaths, deaths counted as 1 when 0"""
+    return ((kills + assists) / np.maximum(deaths, 1)).round(2)
+
+
+def champion_groups(df: pd.DataFrame) -> pd.DataFrame:
+    """sums per (name, championName), shared by the champion pool and the champion statistics"""
+    return df.assign(win=df["win"].astype(int)).groupby(["name", "championName"]).agg(
+        team=("team", "first"),
+        games=("match_id", "count"),
+        wins=("win", "sum"),
+        kills=("kills", "sum"),
+        deaths=("deaths", "sum"),
+        assists=("assists", "sum"),
+        duration=("gameDuration", "sum"),
+        damage=("totalDamageDealtToChampions", "sum"),
+        positions=("teamPosition", lambda positions: positions.mode().iloc[0])
+    ).reset_index()
+
+
+def champion_pool(groups: pd.DataFrame) -> pd.DataFrame:
+    """champions played by each player: games, winrate, KDA"""
+    pool = groups[["name", "team", "championName", "positions", "games", "wins"]].copy()
+    pool["positions"] = pool["positions"].map(position_dict)
+    pool["winrate"] = (groups["wins"] / groups["games"]).round(3)
+    pool["kills"] = (groups["kills"] / groups["games"]).round(2)
+    pool["deaths"] = (groups["deaths"] / groups["games"]).round(2)
+    pool["assists"] = (groups["assists"] / groups["games"]).round(2)
+    pool["kda"] = kda(groups["kills"], groups["deaths"], groups["assists"])
+    pool = pool.rename(columns={"positions": "position"})
+    return pool.sort_values(["team", "name", "games"], ascending=[True, True, False]).reset_index(drop=True)
+
+
+def champion_stats(groups: pd.DataFrame, matches: int) -> pd.DataFrame:
+    """pick / win / KDA statistics per champion, rolled up from the (name, champion) sums"""
+    champions = groups.groupby("championName").agg(
+        picks=("games", "sum"), players=("name", "count"), wins=("wins", "sum"), kills=("kills", "sum"),
+        deaths=("deaths", "sum"), assists=("assists", "sum"), duration=("duration", "sum"), damage=("damage", "sum"))
+    stats = pd.DataFrame({
+        "picks": champions["picks"],
+        "pickrate": (champions["picks"] / matches).round(3) if matches else 0.0,
+        "players": champions["players"],
+        "wins": champions["wins"],
+        "winrate": (champions["wins"] / champions["picks"]).round(3),
+        "kills": (champions["kills"] / champions["picks"]).round(2),
+        "deaths": (champions["deaths"] / champions["picks"]).round(2),
+        "assists": (champions["assists"] / champions["picks"]).round(2),
+        "kda": kda(champions["kills"], champions["deaths"], champions["assists"]),
+        "damagePerMinute": (champions["damage"] / (champions["duration"] / 60)).round(2)
+    })
+    return stats.sort_values(["picks", "winrate"], ascending=False).reset_index()
+
+
+def head_to_head(df: pd.DataFrame) -> tuple:
+    """return (summary per versus and team, one row per versus / round)"""
+    teams = df.assign(win=df["win"].astype(int)).groupby(["versus", "round", "match_id", "team"]).agg(
+        side=("side", "first"), win=("win", "max"), kills=("kills", "sum"), deaths=("deaths", "sum"),
+        gameDuration=("gameDuration", "first")).reset_index()
+
+    summary = teams.groupby(["versus", "team"]).agg(
+        games=("match_id", "count"), wins=("win", "sum"), kills=("kills", "mean"), deaths=("deaths", "mean"),
+        gameDuration=("gameDuration", "mean"), blue_games=("side", lambda sides: int((sides == "blue").sum())))
+    summary["winrate"] = (summary["wins"] / summary["games"]).round(3)
+    summary["gameDuration"] = (summary["gameDuration"] / 60).round(1)  # minutes
+    summary[["kills", "deaths"]] = summary[["kills", "deaths"]].round(2)
+
+    sides = teams.pivot_table(index=["versus", "round", "match_id", "gameDuration"], columns="side",
+                              values=["team", "kills", "win"], aggfunc="first")
+    sides.columns = [f"{side}_{value}" for value, side in sides.columns]
+    rounds = sides.reindex(columns=[f"{side}_{value}" for side in ("blue", "red")
+                                    for value in ("team", "kills", "win")]).reset_index()
+    rounds["winner"] = np.where(rounds["blue_win"] == 1, rounds["blue_team"], rounds["red_team"])
+    rounds["gameDuration"] = (rounds["gameDuration"] / 60).round(1)
+    rounds = rounds[["versus", "round", "match_id", "blue_team", "red_team", "winner", "blue_kills", "red_kills",
+                     "gameDuration"]].rename(columns={"blue_team": "blue", "red_team": "red"})
+    return summary.reset_index(), rounds.sort_values(["versus", "round"]).reset_index(drop=True)
+
+
+@stage("analytics")
+def generate_analytics(tournament: str, reports=REPORTS, server_side=False):
+    """generate the requested reports (players, pool, champions, h2h) from a single load of stats_players
+       -the champion pool and the champion statistics share the (name, champion) group-by
+       -server_side: the player statistics are aggregated in MongoDB (the other reports still use the load)
+    """
+    logger.info(f"generating {', '.join(reports)}...")
+    db = logToDB(tournament)
+    df_players = pd.DataFrame(list(db["players"].find({}, {"_id": 0, "name": 1, "team": 1})))
+
+    with stage("load"):
+        df = pd.DataFrame(list(db["stats_players"].find({}, {"_id": 0})))
+        add_rows("stats_players", len(df))
+    if df.empty:
+        print("No data found.")
+        return
+
+    exports = {}
+    if "players" in reports:
+        with stage("aggregate"):
+            player_stats = aggregate_players_stats_server(db["stats_players"]) if server_side \
+                else aggregate_players_stats(df)
+        export_players_stats(tournament, db, player_stats, df_players)
+
+    if "pool" in reports or "champions" in reports:
+        groups = champion_groups(df)
+        if "pool" in reports:
+            exports["champion_pool"] = {"pool": champion_pool(groups)}
+        if "champions" in reports:
+            exports["champion_stats"] = {"champions": champion_stats(groups, df["match_id"].nunique())}
+
+    if "h2h" in reports:
+        summary, rounds = head_to_head(df)
+        exports["h2h"] = {"summary": summary, "rounds": rounds}
+
+    for file_name, sheets in exports.items():
+        with pd.ExcelWriter(f"tournaments/{tournament}/{file_name}.xlsx") as writer:
+            for sheet, table in sheets.items():
+                table.to_excel(writer, sheet_name=sheet, index=False)
+        print(f"Exported at {tournament}/{file_name}.xlsx")
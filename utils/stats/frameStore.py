@@ -0,0 +1,80 @@
+from utils.common.commonFunctions import *
+from utils.db.timelineStore import find_timelines
+from pymongo import UpdateOne
+from bson.binary import Binary
+import numpy as np
+
+# Compact per-minute participant stats, one document per match in the frame_stats collection:
+# data is the packed int32 array of shape (minutes, 10 participants, fields), frame 0 is the game start
+FRAME_FIELDS = ["cs", "jungleCs", "gold", "xp", "level", "damage"]
+PARTICIPANTS = 10
+
+
+def build_frame_array(timeline: dict) -> np.ndarray:
+    """return the (minutes, 10, fields) array of a timeline, participant i is participantId i + 1"""
+    frames = timeline.get("info", {}).get("frames", [])
+    values = [
+        (frame.get("minionsKilled", 0), frame.get("jungleMinionsKilled", 0), frame.get("totalGold", 0),
+         frame.get("xp", 0), frame.get("level", 0), frame.get("damageStats", {}).get("totalDamageDoneToChampions", 0))
+        for minute in frames
+        for frame in (minute.get("participantFrames", {}).get(str(participant_id), {})
+                      for participant_id in range(1, PARTICIPANTS + 1))
+    ]
+    return np.array(values, dtype=np.int32).reshape(len(frames), PARTICIPANTS, len(FRAME_FIELDS))
+
+
+def frame_document(match_id: str, array: np.ndarray) -> dict:
+    return {
+        "match_id": match_id,
+        "minutes": int(array.shape[0]),
+        "fields": FRAME_FIELDS,
+        "dtype": "int32",
+        "data": Binary(array.astype(np.int32).tobytes())
+    }
+
+
+def unpack_frames(document: dict) -> np.ndarray:
+    """return the array of a frame_stats document"""
+    return np.frombuffer(document["data"], dtype=document.get("dtype", "int32")).reshape(
+        document["minutes"], PARTICIPANTS, len(document.get("fields", FRAME_FIELDS)))
+
+
+def store_frames(db, timelines: dict):
+    """build and upsert the frame_stats documents of {match_id: timeline}"""
+    updates = [
+        UpdateOne({"match_id": match_id}, {"$set": frame_document(match_id, build_frame_array(timeline))}, upsert=True)
+        for match_id, timeline in timelines.items() if timeline
+    ]
+    if updates:
+        db['frame_stats'].bulk_write(updates, ordered=False)
+
+
+def update_frame_store(db, match_ids=None):
+    """build the missing frame_stats documents from the stored timelines (all matches when match_ids is None)"""
+    query = {"match_id": {"$in": list(match_ids)}} if match_ids is not None else {}
+    existing_ids = {document["match_id"] for document in db['frame_stats'].find(query, {"match_id": 1})}
+    timeline_query = {"match_id": {"$nin": list(existing_ids)}}
+    if match_ids is not None:
+        timeline_query["match_id"]["$in"] = list(match_ids)
+
+    batch = {}
+    for timeline in find_timelines(db, timeline_query, {"match_id": 1, "info.frames.participantFrames": 1}):
+        batch[timeline["match_id"]] = timeline
+        if len(batch) == 100:
+            store_frames(db, batch)
+            batch = {}
+    store_frames(db, batch)
+
+
+def load_frames(db, match_ids: list) -> dict:
+    """return {match_id: (minutes, 10, fields) array} of the given matches"""
+    return {document["match_id"]: unpack_frames(document)
+            for document in db['frame_stats'].find({"match_id": {"$in": list(match_ids)}})}
+
+
+def snapshot(db, match_ids: list, minute: int) -> dict:
+    """return {match_id: (10, fields) array} of the participant stats at a given minute
+       -matches shorter than the requested minute are left out
+    """
+    return {match_id: frames[minute] for match_id, frames in load_frames(db, match_ids).items()
+            if frames.shape[0] > minute}
@@ -0,0 +1,69 @@
+from utils.common.commonFunctions import *
+from utils.stats.frameStore import FRAME_FIELDS, PARTICIPANTS, load_frames
+import numpy as np
+import pandas as pd
+
+LANE_DIFF_FIELDS = ["cs", "gold", "xp"]
+
+
+def lane_diff_arrays(db, match_ids: list):
+    """difference with the lane opponent at every minute of every match
+       -returns (match_ids, puuids (M, 10), positions (M, 10), diffs (M, minutes, 10, LANE_DIFF_FIELDS))
+       -minutes after the end of a game and participants without a lane opponent are NaN
+    """
+    frames = load_frames(db, match_ids)
+    matches = list(db['matches'].find(
+        {"match_id": {"$in": list(frames)}},
+        {"match_id": 1, "info.participants.puuid": 1, "info.participants.teamPosition": 1}))
+    matches = [match for match in matches if len(match["info"]["participants"]) == PARTICIPANTS]
+    if not matches:
+        return [], np.empty((0, PARTICIPANTS), dtype=object), np.empty((0, PARTICIPANTS), dtype=object), \
+            np.empty((0, 0, PARTICIPANTS, len(LANE_DIFF_FIELDS)))
+
+    match_ids = [match["match_id"] for match in matches]
+    puuids = np.array([[p["puuid"] for p in match["info"]["participants"]] for match in matches], dtype=object)
+    positions = np.array([[p.get("teamPosition", "") for p in match["info"]["participants"]] for match in matches],
+                         dtype=object)
+
+    # (M, minutes, 10, fields) values padded with NaN after the end of each game
+    minutes = max(frames[match_id].shape[0] for match_id in match_ids)
+    values = np.full((len(match_ids), minutes, PARTICIPANTS, len(LANE_DIFF_FIELDS)), np.nan, dtype=np.float32)
+    cs, jungle_cs, gold, xp = (FRAME_FIELDS.index(field) for field in ("cs", "jungleCs", "gold", "xp"))
+    for index, match_id in enumerate(match_ids):
+        array = frames[match_id]
+        values[index, :array.shape[0], :, 0] = array[:, :, cs] + array[:, :, jungle_cs]
+        values[index, :array.shape[0], :, 1] = array[:, :, gold]
+        values[index, :array.shape[0], :, 2] = array[:, :, xp]
+
+    # lane opponent: participant of the other side with the same teamPosition
+    blue, red = positions[:, :5], positions[:, 5:]
+    same_lane = (blue[:, :, None] == red[:, None, :]) & (blue[:, :, None] != "")
+    opponents = np.concatenate([same_lane.argmax(axis=2) + 5, same_lane.argmax(axis=1)], axis=1)
+    has_opponent = np.concatenate([same_lane.any(axis=2), same_lane.any(axis=1)], axis=1)
+
+    opponent_values = np.take_along_axis(values, opponents[:, None, :, None], axis=2)
+    diffs = values - opponent_values
+    diffs[~np.broadcast_to(has_opponent[:, None, :, None], diffs.shape)] = np.nan
+    return match_ids, puuids, positions, diffs
+
+
+def generate_lane_diff_curves(db) -> pd.DataFrame:
+    """per-player average difference curves with the lane opponent (cs, gold, xp at every minute)"""
+    puuid_to_name = {player["puuid"]: player.get("name") for player in
+                     db['players'].find({"puuid": {"$exists": True, "$ne": ""}}, {"puuid": 1, "name": 1})}
+    match_ids = [document["match_id"] for document in db['frame_stats'].find({}, {"match_id": 1})]
+    match_ids, puuids, positions, diffs = lane_diff_arrays(db, match_ids)
+    if not match_ids:
+        return pd.DataFrame()
+
+    # one row per (match, participant) and one column per (field, minute)
+    curves = diffs.transpose(0, 2, 3, 1).reshape(len(match_ids) * PARTICIPANTS, -1)
+    columns = [f"{field}_diff_{minute}" for field in LANE_DIFF_FIELDS for minute in range(diffs.shape[1])]
+    df = pd.DataFrame(curves, columns=columns, dtype=np.float64)
+    df["name"] = pd.Series(puuids.ravel()).map(puuid_to_name)
+    df["teamPosition"] = positions.ravel()
+    df = df[df["name"].notna() & (df["teamPosition"] != "")]
+
+    lane_curves = df.groupby(["name", "teamPosition"]).mean().round(2).reset_index()
+    lane_curves["teamPosition"] = lane_curves["teamPosition"].map(position_dict)
+    return lane_curves.rename(columns={"teamPosition": "position"})
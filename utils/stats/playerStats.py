@@ -1,99 +1,104 @@
 from utils.common.commonFunctions import *
+from utils.common.runReport import stage, add_rows
+from utils.stats.laneStats import generate_lane_diff_curves
 import pandas as pd
 
 
-def generate_players_stats(tournament: str):
-    """generate a csv file with all player statistics"""
+PLAYER_AGGREGATIONS = {  # output column: (stats_players column, aggregation)
+    "matches_played": ("match_id", "count"),
+    "win_count": ("win", "sum"),
+    "main": ("main", "max"),
+    "kills": ("kills", "mean"),
+    "deaths": ("deaths", "mean"),
+    "assists": ("assists", "mean"),
+    "kda": ("kda", "mean"),
+    "damageDealtToBuildings": ("damageDealtToBuildings", "mean"),
+    "damageDealtToObjectives": ("damageDealtToObjectives", "mean"),
+    "damageDealtToTurrets": ("damageDealtToTurrets", "mean"),
+    "gameDuration": ("gameDuration", "mean"),
+    "damagePerMinute": ("damagePerMinute", "mean"),
+    "damageTakenOnTeamPercentage": ("damageTakenOnTeamPercentage", "mean"),
+    "firstTurretKilled": ("firstTurretKilled", "count"),
+    "goldPerMinute": ("goldPerMinute", "mean"),
+    "killParticipation": ("killParticipation", "sum"),
+    "laneMinionsFirst10Minutes": ("laneMinionsFirst10Minutes", "mean"),
+    "riftHeraldTakedowns": ("riftHeraldTakedowns", "sum"),
+    "soloKills_mean": ("soloKills", "mean"),
+    "soloKills_total": ("soloKills", "sum"),
+    "stealthWardsPlaced": ("stealthWardsPlaced", "mean"),
+    "survivedSingleDigitHpCount": ("survivedSingleDigitHpCount", "sum"),
+    "teamBaronKills": ("teamBaronKills", "mean"),
+    "teamDamagePercentage": ("teamDamagePercentage", "mean"),
+    "teamRiftHeraldKills": ("teamRiftHeraldKills", "mean"),
+    "turretPlatesTaken": ("turretPlatesTaken", "mean"),
+    "voidMonsterKill": ("voidMonsterKill", "mean"),
+    "wardTakedowns": ("wardTakedowns", "mean"),
+    "damageSelfMitigated": ("damageSelfMitigated", "mean"),
+    "firstBloodKill": ("firstBloodKill", "sum"),
+    "largestCriticalStrike": ("largestCriticalStrike", "max"),
+    "largestMultiKill": ("largestMultiKill", "max"),
+    "magicDamageDealt": ("magicDamageDealt", "mean"),
+    "magicDamageDealtToChampions": ("magicDamageDealtToChampions", "mean"),
+    "magicDamageTaken": ("magicDamageTaken", "mean"),
+    "objectivesStolen": ("objectivesStolen", "sum"),
+    "pentaKills": ("pentaKills", "sum"),
+    "physicalDamageDealt": ("physicalDamageDealt", "mean"),
+    "physicalDamageDealtToChampions": ("physicalDamageDealtToChampions", "mean"),
+    "physicalDamageTaken": ("physicalDamageTaken", "mean"),
+    "timeCCingOthers": ("timeCCingOthers", "mean"),
+    "totalDamageDealt": ("totalDamageDealt", "mean"),
+    "totalDamageDealtToChampions": ("totalDamageDealtToChampions", "mean"),
+    "totalDamageShieldedOnTeammates": ("totalDamageShieldedOnTeammates", "mean"),
+    "totalHeal": ("totalHeal", "mean"),
+    "totalHealsOnTeammates": ("totalHealsOnTeammates", "mean"),
+    "totalMinionsKilled": ("totalMinionsKilled", "mean"),
+    "totalTimeCCDealt": ("totalTimeCCDealt", "mean"),
+    "totalTimeSpentDead": ("totalTimeSpentDead", "mean"),
+    "trueDamageDealt": ("trueDamageDealt", "mean"),
+    "trueDamageDealtToChampions": ("trueDamageDealtToChampions", "mean"),
+    "trueDamageTaken": ("trueDamageTaken", "mean"),
+    "turretKills": ("turretKills", "mean"),
+    "visionScore": ("visionScore", "mean"),
+    "visionWardsBoughtInGame": ("visionWardsBoughtInGame", "mean"),
+    "wardsKilled": ("wardsKilled", "mean"),
+    "wardsPlaced": ("wardsPlaced", "mean"),
+    "pinksPlaced": ("pinksPlaced", "mean"),
+    "cs_15": ("cs_15", "mean"),
+    "gold_15": ("gold_15", "mean"),
+    "xp_15": ("xp_15", "mean"),
+    "cs_15_diff": ("cs_15_diff", "mean"),
+    "gold_15_diff": ("gold_15_diff", "mean"),
+    "xp_15_diff": ("xp_15_diff", "mean")
+}
+LANE_STATS = ["cs_15", "gold_15", "xp_15"]
+
+
+@stage("players_stats")
+def generate_players_stats(tournament: str, server_side=False):
+    """generate a csv file with all player statistics
+       -server_side: aggregate stats_players in MongoDB, only the per-player result is sent to Python
+    """
     logger.info("generating players statistics...")
     db = logToDB(tournament)
     players = db["players"]
     stats_players = db["stats_players"]
-    df = pd.DataFrame(list(stats_players.find()))
     df_players = pd.DataFrame(list(players.find()))
 
-    if df.empty:
-        print("No data found.")
-        exit()
+    with stage("aggregate"):
+        if server_side:
+            player_stats = aggregate_players_stats_server(stats_players)
+        else:
+            player_stats = aggregate_players_stats(pd.DataFrame(list(stats_players.find())))
+        add_rows("players", len(player_stats))
 
-    # getting main position
-    main_positions = df.groupby(["name", "teamPosition"]).size().reset_index(name="count")
-    main_positions = main_positions.sort_values(["name", "count"], ascending=[True, False])
-    main_positions = main_positions.drop_duplicates(subset=["name"], keep="first")
+    export_players_stats(tournament, db, player_stats, df_players)
 
-    df = df.merge(main_positions[["name", "teamPosition"]], on="name", suffixes=("", "_main"))
-    df["main"] = df["teamPosition"] == df["teamPosition_main"]
 
-    # Compute matchup stats
-    df["cs_15_diff"] = df.groupby(["match_id", "teamPosition"])["cs_15"].transform(lambda x: 2 * (x - x.mean()))
-    df["gold_15_diff"] = df.groupby(["match_id", "teamPosition"])["gold_15"].transform(lambda x: 2 * (x - x.mean()))
-    df["xp_15_diff"] = df.groupby(["match_id", "teamPosition"])["xp_15"].transform(lambda x: 2 * (x - x.mean()))
-
-    player_stats = df.groupby(["name", "teamPosition"]).agg(
-        matches_played=("match_id", "count"),
-        win_count=("win", "sum"),
-        main=("main", "max"),
-        kills=("kills", "mean"),
-        deaths=("deaths", "mean"),
-        assists=("assists", "mean"),
-        kda=("kda", "mean"),
-        damageDealtToBuildings=("damageDealtToBuildings", "mean"),
-        damageDealtToObjectives=("damageDealtToObjectives", "mean"),
-        damageDealtToTurrets=("damageDealtToTurrets", "mean"),
-        gameDuration=("gameDuration", "mean"),
-        damagePerMinute=("damagePerMinute", "mean"),
-        damageTakenOnTeamPercentage=("damageTakenOnTeamPercentage", "mean"),
-        firstTurretKilled=("firstTurretKilled", "count"),
-        goldPerMinute=("goldPerMinute", "mean"),
-        killParticipation=("killParticipation", "sum"),
-        laneMinionsFirst10Minutes=("laneMinionsFirst10Minutes", "mean"),
-        riftHeraldTakedowns=("riftHeraldTakedowns", "sum"),
-        soloKills_mean=("soloKills", "mean"),
-        soloKills_total=("soloKills", "sum"),
-        stealthWardsPlaced=("stealthWardsPlaced", "mean"),
-        survivedSingleDigitHpCount=("survivedSingleDigitHpCount", "sum"),
-        teamBaronKills=("teamBaronKills", "mean"),
-        teamDamagePercentage=("teamDamagePercentage", "mean"),
-        teamRiftHeraldKills=("teamRiftHeraldKills", "mean"),
-        turretPlatesTaken=("turretPlatesTaken", "mean"),
-        voidMonsterKill=("voidMonsterKill", "mean"),
-        wardTakedowns=("wardTakedowns", "mean"),
-        damageSelfMitigated=("damageSelfMitigated", "mean"),
-        firstBloodKill=("firstBloodKill", "sum"),
-        largestCriticalStrike=("largestCriticalStrike", "max"),
-        largestMultiKill=("largestMultiKill", "max"),
-        magicDamageDealt=("magicDamageDealt", "mean"),
-        magicDamageDealtToChampions=("magicDamageDealtToChampions", "mean"),
-        magicDamageTaken=("magicDamageTaken", "mean"),
-        objectivesStolen=("objectivesStolen", "sum"),
-        pentaKills=("pentaKills", "sum"),
-        physicalDamageDealt=("physicalDamageDealt", "mean"),
-        physicalDamageDealtToChampions=("physicalDamageDealtToChampions", "mean"),
-        physicalDamageTaken=("physicalDamageTaken", "mean"),
-        timeCCingOthers=("timeCCingOthers", "mean"),
-        totalDamageDealt=("totalDamageDealt", "mean"),
-        totalDamageDealtToChampions=("totalDamageDealtToChampions", "mean"),
-        totalDamageShieldedOnTeammates=("totalDamageShieldedOnTeammates", "mean"),
-        totalHeal=("totalHeal", "mean"),
-        totalHealsOnTeammates=("totalHealsOnTeammates", "mean"),
-        totalMinionsKilled=("totalMinionsKilled", "mean"),
-        totalTimeCCDealt=("totalTimeCCDealt", "mean"),
-        totalTimeSpentDead=("totalTimeSpentDead", "mean"),
-        trueDamageDealt=("trueDamageDealt", "mean"),
-        trueDamageDealtToChampions=("trueDamageDealtToChampions", "mean"),
-        trueDamageTaken=("trueDamageTaken", "mean"),
-        turretKills=("turretKills", "mean"),
-        visionScore=("visionScore", "mean"),
-        visionWardsBoughtInGame=("visionWardsBoughtInGame", "mean"),
-        wardsKilled=("wardsKilled", "mean"),
-        wardsPlaced=("wardsPlaced", "mean"),
-        pinksPlaced=("pinksPlaced", "mean"),
-        cs_15=("cs_15", "mean"),
-        gold_15=("gold_15", "mean"),
-        xp_15=("xp_15", "mean"),
-        cs_15_diff=("cs_15_diff", "mean"),
-        gold_15_diff=("gold_15_diff", "mean"),
-        xp_15_diff=("xp_15_diff", "mean")
-    ).round(2).reset_index()
+def export_players_stats(tournament: str, db, player_stats: pd.DataFrame, df_players: pd.DataFrame):
+    """score the aggregated player statistics and export them with the lane matchup curves"""
+    if player_stats.empty:
+        print("No data found.")
+        return
 
     # final steps
     player_stats["winrate"] = round(player_stats["win_count"] / player_stats["matches_played"], 3)
@@ -102,7 +107,8 @@ def generate_players_stats(tournament: str):
     player_stats = player_stats.rename(columns={"teamPosition": "position"})
 
     # scoring
-    player_stats = scoring(player_stats, weighting)
+    with stage("scoring"):
+        player_stats = scoring(player_stats, weighting)
 
     # prepare for export
     first_columns = ["name", "team", "position", "main", "score", "winrate", "matches_played"]
@@ -112,3 +118,85 @@ def generate_players_stats(tournament: str):
     file_name = "players_stats"
     player_stats.to_excel(f"tournaments/{tournament}/{file_name}.xlsx", index=False)
     print(f"Exported at {tournament}/{file_name}.xlsx")
+
+    # lane matchup curves
+    with stage("lane_curves"):
+        lane_curves = generate_lane_diff_curves(db)
+    if not lane_curves.empty:
+        lane_curves = lane_curves.merge(df_players[["name", "team"]], on="name", how="left")
+        file_name = "lane_diff_curves"
+        lane_curves.to_excel(f"tournaments/{tournament}/{file_name}.xlsx", index=False)
+        print(f"Exported at {tournament}/{file_name}.xlsx")
+
+
+def aggregate_players_stats(df: pd.DataFrame) -> pd.DataFrame:
+    """aggregate the stats_players rows per (name, teamPosition) with pandas"""
+    if df.empty:
+        return df
+
+    # getting main position
+    main_positions = df.groupby(["name", "teamPosition"]).size().reset_index(name="count")
+    main_positions = main_positions.sort_values(["name", "count"], ascending=[True, False])
+    main_positions = main_positions.drop_duplicates(subset=["name"], keep="first")
+
+    df = df.merge(main_positions[["name", "teamPosition"]], on="name", suffixes=("", "_main"))
+    df["main"] = df["teamPosition"] == df["teamPosition_main"]
+
+    # Compute matchup stats
+    lane_means = df.groupby(["match_id", "teamPosition"])[LANE_STATS].transform("mean")
+    for stat in LANE_STATS:
+        df[f"{stat}_diff"] = 2 * (df[stat] - lane_means[stat])
+
+    return df.groupby(["name", "teamPosition"]).agg(**PLAYER_AGGREGATIONS).round(2).reset_index()
+
+
+def server_accumulator(column: str, function: str) -> dict:
+    """MongoDB $group accumulator matching a pandas aggregation (NaN / missing values skipped)"""
+    if function == "mean":
+        return {"$avg": f"${column}"}
+    if function == "max":
+        return {"$max": f"${column}"}
+    if function == "count":
+        return {"$sum": {"$cond": [{"$eq": [{"$ifNull": [f"${column}", None]}, None]}, 0, 1]}}
+    if function == "sum":  # booleans are summed as 0/1 like pandas
+        return {"$sum": {"$switch": {"branches": [{"case": {"$eq": [f"${column}", True]}, "then": 1},
+                                                  {"case": {"$eq": [f"${column}", False]}, "then": 0}],
+                                     "default": f"${column}"}}}
+    raise ValueError(f"Unsupported aggregation: {function}")
+
+
+def aggregate_players_stats_server(stats_players) -> pd.DataFrame:
+    """aggregate the stats_players rows per (name, teamPosition) in MongoDB (5.0+ for $setWindowFields)
+       -returns the same table as aggregate_players_stats
+    """
+    group = {"_id": {"name": "$name", "teamPosition": "$teamPosition"}}
+    for output, (column, function) in PLAYER_AGGREGATIONS.items():
+        if output == "main":
+            continue  # depends on the main position, set below
+        if column.endswith("_diff"):
+            # 2 * (x - lane mean) as in the pandas path
+            stat = column[:-len("_diff")]
+            group[output] = {"$avg": {"$multiply": [2, {"$subtract": [f"${stat}", f"$lane_{stat}"]}]}}
+        else:
+            group[output] = server_accumulator(column, function)
+
+    pipeline = [
+        {"$setWindowFields": {
+            "partitionBy": {"match_id": "$match_id", "teamPosition": "$teamPosition"},
+            "output": {f"lane_{stat}": {"$avg": f"${stat}"} for stat in LANE_STATS}
+        }},
+        {"$group": group}
+    ]
+    rows = [{**row.pop("_id"), **row} for row in stats_players.aggregate(pipeline, allowDiskUse=True)]
+    if not rows:
+        return pd.DataFrame()
+
+    player_stats = pd.DataFrame(rows).sort_values(["name", "teamPosition"]).reset_index(drop=True)
+
+    # getting main position
+    main_positions = player_stats.sort_values(["name", "matches_played"], ascending=[True, False])
+    main_positions = main_positions.drop_duplicates(subset=["name"], keep="first")
+    player_stats = player_stats.merge(main_positions[["name", "teamPosition"]], on="name", suffixes=("", "_main"))
+    player_stats["main"] = player_stats["teamPosition"] == player_stats["teamPosition_main"]
+
+    return player_stats[["name", "teamPosition"] + list(PLAYER_AGGREGATIONS)].round(2)
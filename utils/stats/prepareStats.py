@@ -1,52 +1,94 @@
 from utils.common.commonFunctions import *
+from utils.common.runReport import stage, add_rows
+from pymongo import UpdateOne
+from datetime import datetime
+from utils.stats.frameStore import FRAME_FIELDS, update_frame_store, load_frames
 
+# minute of the "_15" stats (frames are 60s apart, frame 0 is the game start)
+FRAME_15 = 15
+BATCH_SIZE = 500
 
-def generate_player_match_stats(tournament: str):
-    """generate the stats per match/player to allow fast statistics generation"""
-    logger.info("updating stats_players table...")
+
+@stage("player_match_stats")
+def generate_player_match_stats(tournament: str, full=False):
+    """generate the stats per match/player to allow fast statistics generation
+       -only the matches not yet materialized (no stats_at marker) are processed
+       -full: drop stats_players and rebuild it from every match (e.g. after a schema change)
+       -returns the number of matches materialized
+    """
+    logger.info("rebuilding stats_players table..." if full else "updating stats_players table...")
 
     db = logToDB(tournament)
     players = db['players']
     matches = db['matches']
-    timelines = db['timelines']
     stats_players = db['stats_players']
 
-    # Récupérer les données de match
-    match_data = matches.find()
+    if full:
+        stats_players.delete_many({})
+        matches.update_many({}, {"$unset": {"stats_at": ""}})
+
+    puuid_to_name = {player["puuid"]: player.get("name") for player in
+                     players.find({"puuid": {"$exists": True, "$ne": ""}}, {"puuid": 1, "name": 1})}
 
+    # Récupérer les données de match (with context, not yet materialized)
+    match_data = matches.find({"round": {"$exists": True}, "stats_at": {"$exists": False}},
+                              {"match_id": 1, "versus": 1, "round": 1, "blue": 1, "red": 1,
+                               "info.participants": 1, "info.gameDuration": 1})
+
+    processed = materialized = 0
+    batch = []
     for match in match_data:
-        match_id = match["match_id"]
-        participants = match["info"]["participants"]
+        batch.append(match)
+        if len(batch) == BATCH_SIZE:
+            processed += len(batch)
+            materialized += materialize_batch(db, batch, puuid_to_name)
+            batch = []
+    if batch:
+        processed += len(batch)
+        materialized += materialize_batch(db, batch, puuid_to_name)
+    logger.info(f"stats_players updated for {processed} matches")
+    add_rows("matches", processed)
+    return materialized
 
-        timeline = timelines.find_one({"match_id": match_id})
-        frames = timeline.get("info", {}).get("frames", [])
 
-        # Vérifier si la 15e frame existe
-        if len(frames) > 15:
-            frame_15 = frames[16].get("participantFrames", {})
+def materialize_batch(db, batch: list, puuid_to_name: dict) -> int:
+    """write the stats of a batch of matches and mark the matches whose timeline is available as materialized
+       (matches still waiting for their timeline are processed again on the next refresh)
+       -returns the number of matches materialized
+    """
+    match_ids = [match["match_id"] for match in batch]
+    update_frame_store(db, match_ids)
+    frames = load_frames(db, match_ids)
+    frames_15 = {match_id: array[FRAME_15] if array.shape[0] > FRAME_15 else None for match_id, array in frames.items()}
+    write_player_match_stats(db['stats_players'], batch, frames_15, puuid_to_name)
+    db['matches'].update_many({"match_id": {"$in": list(frames)}}, {"$set": {"stats_at": datetime.utcnow()}})
+    return len(frames)
 
-        else:
-            frame_15 = {}  # Valeur par défaut si la frame n'existe pas
 
-        # mapping participantId -> puuid
-        participant_id_to_puuid = {
-            participant["participantId"]: participant["puuid"]
-            for participant in match["info"]["participants"]
-        }
+def write_player_match_stats(stats_players, matches: list, frames_15: dict, puuid_to_name: dict):
+    """upsert the stats_players rows of a batch of matches with one bulk_write
+       -frames_15: {match_id: (10, fields) frame store snapshot at 15min, or None}
+    """
+    cs, jungle_cs, gold, xp = (FRAME_FIELDS.index(field) for field in ("cs", "jungleCs", "gold", "xp"))
+    updates = []
+    for match in matches:
+        match_id = match["match_id"]
+        participants = match["info"]["participants"]
+        frame_15 = frames_15.get(match_id)  # None si la frame n'existe pas
 
         # Basic stats
-        for participant in participants:
-            name = players.find_one({"puuid": participant["puuid"]})["name"]
-            participant_id = next(
-                (p_id for p_id, puuid in participant_id_to_puuid.items() if puuid == participant["puuid"]), None
-            )
+        for index, participant in enumerate(participants):
+            name = puuid_to_name.get(participant["puuid"])
+            if name is None:
+                logger.warning(f"Unknown player {participant['puuid']} in match {match_id}")
+                continue
 
             # getting stats at 15min
-            if participant_id:
-                frame_data = frame_15.get(str(participant_id), {})
-                cs_15 = frame_data.get("minionsKilled", 0) + frame_data.get("jungleMinionsKilled", 0)
-                gold_15 = frame_data.get("totalGold", 0)
-                xp_15 = frame_data.get("xp", 0)
+            if frame_15 is not None:
+                frame_data = frame_15[participant["participantId"] - 1]
+                cs_15 = int(frame_data[cs] + frame_data[jungle_cs])
+                gold_15 = int(frame_data[gold])
+                xp_15 = int(frame_data[xp])
             else:
                 cs_15, gold_15, xp_15 = 0, 0, 0
 
@@ -55,8 +97,8 @@ def generate_player_match_stats(tournament: str):
                 "versus": match["versus"],
                 "round": match["round"],
                 "name": name,
-                "team": match["blue"] if participants.index(participant) < 5 else match["red"],
-                "side": "blue" if participants.index(participant) < 5 else "red",
+                "team": match["blue"] if index < 5 else match["red"],
+                "side": "blue" if index < 5 else "red",
                 "teamPosition": participant["teamPosition"],
                 "championId": participant["championId"],
                 "championName": participant["championName"],
@@ -122,8 +164,12 @@ def generate_player_match_stats(tournament: str):
             }
 
             # Mettre à jour ou insérer les statistiques du joueur
-            stats_players.update_one(
+            updates.append(UpdateOne(
                 {"match_id": match_id, "name": name},
                 {"$set": player_stats},
                 upsert=True
-            )
+            ))
+
+    if updates:
+        stats_players.bulk_write(updates, ordered=False)
+        add_rows("stats_players", len(updates))
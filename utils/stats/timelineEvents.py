@@ -0,0 +1,205 @@
+from utils.common.commonFunctions import *
+from utils.common.runReport import stage, add_rows
+from utils.db.timelineStore import find_timelines
+from utils.stats.frameStore import FRAME_FIELDS, build_frame_array
+from pymongo import UpdateOne
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Timeline events kept, as (kind, team) rows: the team is the side credited with the event (0 blue, 1 red)
+EVENT_KINDS = ["kill", "tower", "inhibitor", "dragon", "herald", "baron", "voidgrub"]
+MONSTER_KINDS = {"DRAGON": "dragon", "RIFTHERALD": "herald", "BARON_NASHOR": "baron", "HORDE": "voidgrub"}
+BUILDING_KINDS = {"TOWER_BUILDING": "tower", "INHIBITOR_BUILDING": "inhibitor"}
+# epic monsters counted in the objective control
+CONTROL_KINDS = ["dragon", "herald", "baron", "voidgrub"]
+SIDES = ["blue", "red"]
+# gold lead snapshots (minutes) and the deficit overcome by the winner to flag a comeback
+LEAD_MINUTES = [10, 15, 20]
+COMEBACK_GOLD = 5000
+# timelines read one per round trip (pymongo decodes a whole reply batch at once), each one is reduced to its
+# event columns and gold lead before the next one is read; the features are computed by STREAM_BATCH reduced items
+TIMELINE_CURSOR_BATCH = 1
+STREAM_BATCH = 50
+BATCH_SIZE = 100
+TIMELINE_FIELDS = {"match_id": 1, "versus": 1, "round": 1, "blue": 1, "red": 1, "info.frames": 1}
+CONTEXT_FIELDS = ["versus", "round", "blue", "red"]
+# event fields read as columns: (field, default)
+EVENT_COLUMNS = [("type", ""), ("timestamp", 0), ("victimId", 0), ("teamId", 0), ("killerTeamId", 0),
+                 ("monsterType", ""), ("buildingType", ""), ("winningTeam", 0)]
+
+
+def gold_lead(timeline: dict) -> np.ndarray:
+    """blue minus red total gold at each minute"""
+    gold = build_frame_array(timeline)[:, :, FRAME_FIELDS.index("gold")].astype(np.int64)
+    return gold[:, :5].sum(axis=1) - gold[:, 5:].sum(axis=1)
+
+
+def timeline_columns(timeline: dict) -> dict:
+    """flatten the events of a timeline into columns, with its gold lead and context (the timeline can be freed)"""
+    events = [event for frame in timeline.get("info", {}).get("frames", []) for event in frame.get("events", [])]
+    item = {"match_id": timeline["match_id"], "lead": gold_lead(timeline),
+            "columns": {field: [event.get(field, default) for event in events] for field, default in EVENT_COLUMNS}}
+    item.update({field: timeline[field] for field in CONTEXT_FIELDS if field in timeline})
+    return item
+
+
+def event_kinds(columns: dict) -> tuple:
+    """return the (kind, side) arrays of the events, kind -1 for the events not analysed
+       -side credited: the victim's opponents for a kill (also when killerId is 0), the opponents of teamId
+        (the side losing the building) for a building, killerTeamId for a monster
+    """
+    event_type = columns["type"]
+    kill = event_type == "CHAMPION_KILL"
+    building = event_type == "BUILDING_KILL"
+    monster = event_type == "ELITE_MONSTER_KILL"
+    conditions = [kill] + [building & (columns["buildingType"] == name) for name in BUILDING_KINDS] + \
+                 [monster & (columns["monsterType"] == name) for name in MONSTER_KINDS]
+    codes = [EVENT_KINDS.index(kind) for kind in ["kill", *BUILDING_KINDS.values(), *MONSTER_KINDS.values()]]
+    kinds = np.select(conditions, codes, -1)
+    sides = np.select([kill, building, monster],
+                      [columns["victimId"] <= 5, columns["teamId"] == 100, columns["killerTeamId"] == 200], 0)
+    return kinds, sides.astype(np.int64)
+
+
+def batch_features(batch: list) -> list:
+    """features of a batch of timeline_columns items, computed on the concatenated event columns of the batch
+       -firsts: time (s) and side of the first kill, tower, inhibitor, dragon, herald, baron, voidgrub
+       -sides: events taken by each side and its share of the epic monsters (objective control)
+       -gold lead curve (blue - red per minute), largest lead of each side, lead changes, comeback flag
+    """
+    matches, kind_count = len(batch), len(EVENT_KINDS)
+    match = np.repeat(np.arange(matches), [len(item["columns"]["type"]) for item in batch])
+    columns = {field: np.array([value for item in batch for value in item["columns"][field]],
+                               dtype=object if isinstance(default, str) else np.int64)
+               for field, default in EVENT_COLUMNS}
+
+    # winning side, -1 when the game end is missing
+    winners = np.full(matches, -1)
+    end = columns["type"] == "GAME_END"
+    winners[match[end]] = np.select([columns["winningTeam"][end] == 100, columns["winningTeam"][end] == 200],
+                                    [0, 1], -1)
+
+    # events per (match, kind, side)
+    kinds, sides = event_kinds(columns)
+    kept = kinds >= 0
+    match, kinds, sides, timestamps = match[kept], kinds[kept], sides[kept], columns["timestamp"][kept]
+    counts = np.zeros((matches, kind_count, 2), dtype=np.int64)
+    np.add.at(counts, (match, kinds, sides), 1)
+
+    # first event of each (match, kind): first row of each key once sorted by match, kind and time
+    order = np.lexsort((timestamps, kinds, match))
+    keys, rows = np.unique(match[order] * kind_count + kinds[order], return_index=True)
+    first_time = np.full((matches, kind_count), -1)
+    first_side = np.zeros((matches, kind_count), dtype=np.int64)
+    first_time[keys // kind_count, keys % kind_count] = timestamps[order][rows]
+    first_side[keys // kind_count, keys % kind_count] = sides[order][rows]
+
+    control = counts[:, [EVENT_KINDS.index(kind) for kind in CONTROL_KINDS], :].sum(axis=1)
+    control_total = control.sum(axis=1)
+
+    # gold lead curves padded with 0 into a (matches, minutes) matrix
+    lengths = np.array([item["lead"].size for item in batch])
+    minutes = max(int(lengths.max()), 1)
+    leads = np.zeros((matches, minutes), dtype=np.int64)
+    leads[np.arange(minutes) < lengths[:, None]] = np.concatenate([item["lead"] for item in batch])
+    max_lead = np.stack([leads.max(axis=1).clip(0), (-leads.min(axis=1)).clip(0)], axis=1)
+    # lead changes: the minutes without a lead carry the previous sign
+    signs = np.sign(leads)
+    carried = np.maximum.accumulate(np.where(signs != 0, np.arange(minutes), 0), axis=1)
+    signs = np.take_along_axis(signs, carried, axis=1)
+    lead_changes = (signs[:, 1:] * signs[:, :-1] < 0).sum(axis=1)
+    # largest lead of the loser = largest deficit of the winner
+    deficits = max_lead[np.arange(matches), 1 - winners.clip(0)]
+
+    features = []
+    for index, item in enumerate(batch):
+        winner = winners[index]
+        document = {
+            "match_id": item["match_id"],
+            "winner": SIDES[winner] if winner >= 0 else None,
+            "firsts": {kind: {"time": round(int(first_time[index, code]) / 1000, 1),
+                              "side": SIDES[first_side[index, code]]}
+                       for code, kind in enumerate(EVENT_KINDS) if first_time[index, code] >= 0},
+            "sides": {side: dict({kind: int(counts[index, code, column]) for code, kind in enumerate(EVENT_KINDS)},
+                                 objective_control=round(float(control[index, column] / control_total[index]), 3)
+                                 if control_total[index] else None)
+                      for column, side in enumerate(SIDES)}
+        }
+        document.update({field: item[field] for field in CONTEXT_FIELDS if field in item})
+        if lengths[index]:
+            document.update({
+                "gold_lead": item["lead"].tolist(),
+                "max_lead": {"blue": int(max_lead[index, 0]), "red": int(max_lead[index, 1])},
+                "lead_changes": int(lead_changes[index]),
+                **{f"gold_lead_{minute}": int(leads[index, minute]) for minute in LEAD_MINUTES
+                   if lengths[index] > minute}
+            })
+            if winner >= 0:
+                document["comeback_deficit"] = int(deficits[index])
+                document["comeback"] = bool(deficits[index] >= COMEBACK_GOLD)
+        features.append(document)
+    return features
+
+
+def stream_timeline_features(db, query=None):
+    """yield the features of the timelines matching query
+       -a single full timeline is in memory at a time: it is reduced to its event columns before the next one is read
+       -features are computed per batch of STREAM_BATCH reduced timelines
+    """
+    batch = []
+    for timeline in find_timelines(db, query or {}, TIMELINE_FIELDS, batch_size=TIMELINE_CURSOR_BATCH):
+        batch.append(timeline_columns(timeline))
+        if len(batch) == STREAM_BATCH:
+            yield from batch_features(batch)
+            batch = []
+    if batch:
+        yield from batch_features(batch)
+
+
+def update_timeline_features(db, full=False) -> int:
+    """compute the timeline_features documents of the timelines not analysed yet (all of them when full)
+       -returns the number of matches analysed
+    """
+    if full:
+        db['timeline_features'].delete_many({})
+    existing_ids = [document["match_id"] for document in db['timeline_features'].find({}, {"match_id": 1})]
+
+    now = datetime.utcnow()
+    analysed = 0
+    updates = []
+    for features in stream_timeline_features(db, {"match_id": {"$nin": existing_ids}}):
+        updates.append(UpdateOne({"match_id": features["match_id"]}, {"$set": dict(features, computed_at=now)},
+                                 upsert=True))
+        if len(updates) == BATCH_SIZE:
+            db['timeline_features'].bulk_write(updates, ordered=False)
+            analysed += len(updates)
+            updates = []
+    if updates:
+        db['timeline_features'].bulk_write(updates, ordered=False)
+        analysed += len(updates)
+    return analysed
+
+
+@stage("timeline_events")
+def generate_timeline_features(tournament: str, full=False):
+    """analyse the new timelines, then export one row per match (gold lead curves left out)"""
+    logger.info("analysing timeline events...")
+    db = logToDB(tournament)
+    analysed = update_timeline_features(db, full=full)
+    add_rows("timelines", analysed)
+    logger.info(f"timeline_features updated for {analysed} matches")
+
+    features = list(db['timeline_features'].find({}, {"_id": 0, "gold_lead": 0, "computed_at": 0}))
+    if not features:
+        print("No data found.")
+        return
+    df = pd.json_normalize(features, sep="_")
+    first_columns = [column for column in ["match_id", "versus", "round", "blue", "red", "winner", "comeback"]
+                     if column in df.columns]
+    df = df[first_columns + sorted(column for column in df.columns if column not in first_columns)]
+
+    file_name = "timeline_features"
+    df.sort_values([column for column in ["versus", "round", "match_id"] if column in df.columns]).to_excel(
+        f"tournaments/{tournament}/{file_name}.xlsx", index=False)
+    print(f"Exported at {tournament}/{file_name}.xlsx")
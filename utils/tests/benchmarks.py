@@ -0,0 +1,216 @@
+from utils.common.commonFunctions import *
+from utils.db.migrations import bootstrap_schema
+from utils.db.updateDB import update_context
+from utils.db.timelineStore import store_timelines
+from utils.stats.prepareStats import generate_player_match_stats
+from utils.stats.playerStats import generate_players_stats, aggregate_players_stats
+from utils.tests.syntheticTournament import SyntheticTournament
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+
+SIZES = [100, 1000, 10000]
+# mongomock scans a whole collection on every keyed update: only the smallest size runs in a reasonable time
+IN_MEMORY_SIZES = [100]
+# one baseline per backend: mongomock and MongoDB throughputs are not comparable
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline_{backend}.json")
+# mongomock timings are noisier (pure Python, one process): wider default tolerance than with MongoDB
+THRESHOLDS = {"mongodb": 0.25, "mongomock": 0.4}
+# settings of a run that must match the baseline's for the numbers to be compared
+BASELINE_SETTINGS = ["backend", "timeline_storage", "memory_traced"]
+LOAD_BATCH = 500
+CALIBRATION_ROUNDS = 5
+
+
+def load_dataset(db, size: int, seed=0, timeline_storage="compressed"):
+    """insert a synthetic tournament of `size` matches (players, matches, timelines) in db
+       -about 24 games per team, like a long tournament
+    """
+    tournament = SyntheticTournament(teams=max(8, size // 12), games=size, seed=seed, cache_size=LOAD_BATCH)
+    db['players'].insert_many([{"gameName": player["gameName"], "tagLine": player["tagLine"], "team": player["team"],
+                                "name": player["name"], "puuid": player["puuid"]} for player in tournament.players])
+    for start in range(0, size, LOAD_BATCH):
+        games = tournament.schedule[start:start + LOAD_BATCH]
+        db['matches'].insert_many([dict(tournament.match(game["match_id"]), match_id=game["match_id"],
+                                        created_at=datetime.utcnow()) for game in games])
+        store_timelines(db, {game["match_id"]: tournament.timeline(game["match_id"]) for game in games},
+                        timeline_storage)
+
+
+def calibrate() -> float:
+    """speed of this machine (loops/s, best of CALIBRATION_ROUNDS) on a fixed dict and list workload
+       -throughputs are compared relative to it, so a slower or busier machine does not look like a regression
+    """
+    best = None
+    for _ in range(CALIBRATION_ROUNDS):
+        start = time.perf_counter()
+        for index in range(20000):
+            document = {"match_id": index, "stats": [index * slot for slot in range(10)]}
+            json.loads(json.dumps(document))
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return round(20000 / best, 1)
+
+
+def measure(function, memory=True) -> tuple:
+    """return (result, seconds, peak MB of the Python allocations or None) of function()"""
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function()
+        return result, time.perf_counter() - start, \
+            round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2) if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+
+
+def run_size(size: int, memory=True, timeline_storage="compressed") -> dict:
+    """run every stage on a fresh dataset of `size` matches, return {stage: measures}"""
+    tournament = f"benchmark_{size}"
+    db = logToDB(tournament)
+    for collection in db.list_collection_names():
+        db.drop_collection(collection)
+    bootstrap_schema(db)  # indexes and schema version were dropped too, the cached handle does not redo them
+    load_dataset(db, size, timeline_storage=timeline_storage)
+    os.makedirs(f"tournaments/{tournament}", exist_ok=True)
+
+    results = {}
+
+    def record(stage, items, seconds, peak):
+        results[stage] = {"items": items, "seconds": round(seconds, 3),
+                          "throughput_per_s": round(items / seconds, 2) if seconds else None, "peak_mb": peak}
+        logger.info(f"{size} matches - {stage}: {results[stage]['seconds']}s, "
+                    f"{results[stage]['throughput_per_s']} items/s, peak {peak} MB")
+
+    _, seconds, peak = measure(lambda: update_context(db), memory)
+    record("update_context", size, seconds, peak)
+    _, seconds, peak = measure(lambda: generate_player_match_stats(tournament), memory)
+    record("generate_player_match_stats", size, seconds, peak)
+    _, seconds, peak = measure(lambda: generate_players_stats(tournament), memory)
+    record("generate_players_stats", size, seconds, peak)
+
+    # scoring alone, on the aggregated player statistics
+    player_stats = aggregate_players_stats(pd.DataFrame(list(db['stats_players'].find())))
+    player_stats["winrate"] = round(player_stats["win_count"] / player_stats["matches_played"], 3)
+    player_stats = player_stats.rename(columns={"teamPosition": "position"})
+    player_stats["position"] = player_stats["position"].map(position_dict)
+    _, seconds, peak = measure(lambda: scoring(player_stats, weighting), memory)
+    record("scoring", len(player_stats), seconds, peak)
+
+    for collection in db.list_collection_names():
+        db.drop_collection(collection)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, calibration=None) -> list:
+    """return the regressions: throughput below or peak memory above the baseline by more than threshold
+       -the baseline throughputs are scaled by the calibration ratio of the two machines when both are known
+    """
+    regressions = []
+    scale = calibration / baseline["calibration"] if calibration and baseline.get("calibration") else 1.0
+    for size, stages in results.items():
+        for stage, measures in stages.items():
+            reference = baseline.get("results", {}).get(size, {}).get(stage)
+            if not reference:
+                continue
+            expected = reference["throughput_per_s"] * scale if reference["throughput_per_s"] else None
+            if expected and measures["throughput_per_s"] is not None and \
+                    measures["throughput_per_s"] < expected * (1 - threshold):
+                regressions.append(f"{size} matches - {stage}: {measures['throughput_per_s']} items/s "
+                                   f"(baseline {reference['throughput_per_s']}, {round(expected, 2)} on this machine)")
+            if reference.get("peak_mb") and measures["peak_mb"] is not None and \
+                    measures["peak_mb"] > reference["peak_mb"] * (1 + threshold):
+                regressions.append(f"{size} matches - {stage}: peak {measures['peak_mb']} MB "
+                                   f"(baseline {reference['peak_mb']} MB)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the pipeline stages on synthetic tournaments")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        help="numbers of matches (default: 100 1000 10000 with MongoDB, 100 in memory)")
+    parser.add_argument("--mongodb-uri", help="local MongoDB to use (default: in-memory mongomock)")
+    parser.add_argument("--timeline-storage", default="compressed", choices=["compressed", "document"],
+                        help="storage of the generated timelines (default: compressed, to fit 10k in memory)")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace the peak memory (faster)")
+    parser.add_argument("--baseline", help="baseline JSON file (default: utils/tests/benchmark_baseline_<backend>.json)")
+    parser.add_argument("--threshold", type=float,
+                        help="tolerated regression (default: 0.25 with MongoDB, 0.4 in memory)")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    arguments = parser.parse_args(argv)
+
+    if arguments.mongodb_uri:
+        client = MongoClient(arguments.mongodb_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    setMongoClient(client)
+    backend = "mongodb" if arguments.mongodb_uri else "mongomock"
+    sizes = arguments.sizes or (SIZES if arguments.mongodb_uri else IN_MEMORY_SIZES)
+    baseline_file = arguments.baseline or BASELINE.format(backend=backend)
+    threshold = arguments.threshold if arguments.threshold is not None else THRESHOLDS[backend]
+    calibration = calibrate()
+
+    workdir = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="benchmark_"))  # exports are written in tournaments/<name>
+    try:
+        results = {str(size): run_size(size, memory=not arguments.no_memory,
+                                       timeline_storage=arguments.timeline_storage) for size in sizes}
+    finally:
+        os.chdir(workdir)
+    # measured before and after the stages, to follow a load change of the machine during the run
+    calibration = round((calibration + calibrate()) / 2, 1)
+    logger.info(f"Calibration: {calibration} loops/s")
+
+    report = {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "backend": backend,
+        "timeline_storage": arguments.timeline_storage,
+        "memory_traced": not arguments.no_memory,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "calibration": calibration,
+        "results": results
+    }
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if arguments.update_baseline:
+        with open(baseline_file, "w") as file:
+            json.dump(report, file, indent=2)
+        logger.info(f"Baseline written at {baseline_file}")
+        return 0
+
+    if not os.path.exists(baseline_file):
+        logger.warning(f"No baseline at {baseline_file}, run with --update-baseline to create it")
+        return 0
+    with open(baseline_file) as file:
+        baseline = json.load(file)
+    mismatches = [f"{setting}: {baseline.get(setting)} in the baseline, {report[setting]} here"
+                  for setting in BASELINE_SETTINGS if baseline.get(setting) != report[setting]]
+    if mismatches:
+        logger.error(f"Not compared, the baseline {baseline_file} was measured with other settings "
+                     f"({'; '.join(mismatches)})")
+        return 2
+
+    regressions = compare(results, baseline, threshold, calibration)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    if not regressions:
+        logger.info("No regression")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
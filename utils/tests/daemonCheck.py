@@ -0,0 +1,136 @@
+from utils.common.commonFunctions import *
+from utils.common.riotApi import getClient
+from utils.db.liveDaemon import run_daemon, END_GRACE
+from utils.db.updateDB import update_players
+from utils.tests.fakeRiotServer import RiotStandIn
+from utils.tests.syntheticTournament import SyntheticTournament
+import argparse
+import os
+import sys
+import tempfile
+
+TOURNAMENT = "DaemonCheck"
+API_KEY = "daemon-check"
+LIVE_INTERVAL = 120
+IDLE_INTERVAL = 1800
+# simulated duration of a polling cycle, taken off the live interval by the daemon
+CYCLE_TIME = 30
+
+
+class FakeClock:
+    """clock and sleep of the daemon: the time only moves when the daemon sleeps or a cycle is simulated"""
+
+    def __init__(self, now: float):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def check(failures: list, condition: bool, message: str):
+    logger.info(f"{'ok' if condition else 'FAILED'}: {message}")
+    if not condition:
+        failures.append(message)
+
+
+def run_checks(tournament: SyntheticTournament, server: RiotStandIn) -> list:
+    """run the daemon for two bounded cycles before, during and after the tournament window
+       -returns the failed checks
+    """
+    failures = []
+    db = logToDB(TOURNAMENT)
+    client = getClient(API_KEY)
+    update_players(TOURNAMENT)
+    complete_games = sum(game["endOfGameResult"] == "GameComplete" for game in tournament.schedule)
+
+    def on_cycle():
+        pools.append(client.pool)
+        clock.advance(CYCLE_TIME)
+
+    # 5 minutes before the start: one idle wait up to the start, then a live cycle ingesting every game
+    pools = []
+    clock = FakeClock(tournament.start_timestamp - 300)
+    requests = server.stats["requests"]
+    cycles = run_daemon(TOURNAMENT, live_interval=LIVE_INTERVAL, idle_interval=IDLE_INTERVAL, max_cycles=2,
+                        clock=clock, sleep=clock.sleep, on_cycle=on_cycle)
+    check(failures, cycles == 2, f"2 cycles run before the window opens ({cycles})")
+    check(failures, clock.sleeps == [300, LIVE_INTERVAL - CYCLE_TIME],
+          f"idle wait until the start, then the live interval minus the cycle time ({clock.sleeps})")
+    check(failures, len(pools) == 1, f"no polling before the start ({len(pools)} polling cycles)")
+    check(failures, db['matches'].count_documents({}) == complete_games,
+          f"{complete_games} complete games ingested ({db['matches'].count_documents({})})")
+    check(failures, db['stats_players'].count_documents({}) == 10 * complete_games,
+          f"one stats row per player and game ({db['stats_players'].count_documents({})})")
+    check(failures, os.path.exists(f"tournaments/{TOURNAMENT}/players_stats.xlsx"), "statistics exported")
+    check(failures, client.pool is None, "worker threads stopped with the daemon")
+    first_requests = server.stats["requests"] - requests
+
+    # during the window: nothing new, both cycles share the worker threads (and their sessions)
+    pools = []
+    clock = FakeClock(tournament.start_timestamp + 3600)
+    cycles = run_daemon(TOURNAMENT, live_interval=LIVE_INTERVAL, idle_interval=IDLE_INTERVAL, max_cycles=2,
+                        clock=clock, sleep=clock.sleep, on_cycle=on_cycle)
+    check(failures, cycles == 2 and clock.sleeps == [LIVE_INTERVAL - CYCLE_TIME] * 2,
+          f"2 live cycles ({cycles}, {clock.sleeps})")
+    check(failures, len(pools) == 2 and pools[0] is not None and pools[0] is pools[1],
+          "one executor for every cycle of the daemon")
+    check(failures, db['matches'].count_documents({}) == complete_games
+          and db['stats_players'].count_documents({}) == 10 * complete_games, "no game ingested twice")
+    check(failures, server.stats["requests"] - requests - first_requests < first_requests,
+          "known games are not fetched again")
+
+    # after the window and its grace: the daemon stops without polling
+    requests = server.stats["requests"]
+    clock = FakeClock(tournament.end_timestamp + END_GRACE + 1)
+    cycles = run_daemon(TOURNAMENT, max_cycles=2, clock=clock, sleep=clock.sleep)
+    check(failures, cycles == 0 and not clock.sleeps and server.stats["requests"] == requests,
+          f"stopped after the window ({cycles} cycles, {server.stats['requests'] - requests} requests)")
+
+    if server.rate_limit_ratio:
+        check(failures, server.stats["rate_limited"] > 0,
+              f"{server.stats['rate_limited']} answers 429 retried without losing a game")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bounded run of the live daemon against the Riot API stand-in")
+    parser.add_argument("--teams", type=int, default=4)
+    parser.add_argument("--games", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.05, help="share of requests answered 429")
+    arguments = parser.parse_args(argv)
+
+    import mongomock
+    setMongoClient(mongomock.MongoClient())
+    tournament = SyntheticTournament(teams=arguments.teams, games=arguments.games, seed=arguments.seed, hours=2)
+    server = RiotStandIn(tournament, api_key=API_KEY, rate_limit_ratio=arguments.rate_limit_ratio).start()
+
+    workdir = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="daemon_"))  # the daemon reads .env and tournaments/<name>
+    try:
+        tournament.write_tournament(TOURNAMENT)
+        with open(".env", "w") as file:
+            file.write(f"TOORNAMENT_NAME={TOURNAMENT}\nAPI_KEY={API_KEY}\n")
+            file.write("".join(f"{key}={value}\n" for key, value in server.env_routes().items()))
+        failures = run_checks(tournament, server)
+    finally:
+        os.chdir(workdir)
+        server.stop()
+
+    if failures:
+        logger.error(f"{len(failures)} daemon checks failed")
+        return 1
+    logger.info("Daemon checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
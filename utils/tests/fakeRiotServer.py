@@ -0,0 +1,192 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+from utils.tests.syntheticTournament import SyntheticTournament
+import argparse
+import json
+import random
+import re
+import threading
+import time
+
+# Routes of the .env urls (PUUID_URL, MATCHSLIST_URL, MATCHDATA_URL, MATCHTIMELINE_URL)
+ROUTES = [
+    ("account", re.compile(r"^/riot/account/v1/accounts/by-riot-id/([^/]+)/([^/]+)$")),
+    ("matchlist", re.compile(r"^/lol/match/v5/matches/by-puuid/([^/]+)/ids$")),
+    ("timeline", re.compile(r"^/lol/match/v5/matches/([^/]+)/timeline$")),
+    ("match", re.compile(r"^/lol/match/v5/matches/([^/]+)$"))
+]
+# Limits sent back in the X-*-Rate-Limit headers, the client follows them after the first answer
+APP_LIMITS = "500:1,30000:600"
+METHOD_LIMITS = {"account": "1000:60", "matchlist": "2000:10", "match": "2000:10", "timeline": "2000:10"}
+
+
+class FixedWindowCounter:
+    """request counts of a "count:seconds,..." limit, like the Riot counters"""
+
+    def __init__(self, limits: str):
+        self.limits = limits
+        self.windows = [[int(count), int(seconds), 0, 0.0] for count, seconds in
+                        (part.split(":") for part in limits.split(","))]
+        self.lock = threading.Lock()
+
+    def hit(self) -> tuple:
+        """count a request, return (counts header, seconds to wait if a limit is exceeded else 0)"""
+        now = time.monotonic()
+        with self.lock:
+            retry_after = 0
+            for window in self.windows:
+                count, seconds, used, started = window
+                if now - started >= seconds:
+                    window[2], window[3] = 0, now
+                window[2] += 1
+                if window[2] > count:
+                    retry_after = max(retry_after, seconds - (now - window[3]))
+            return ",".join(f"{used}:{seconds}" for _, seconds, used, _ in self.windows), retry_after
+
+
+class RiotStandIn(ThreadingHTTPServer):
+    """Local stand-in of the Riot API serving a SyntheticTournament
+       -latency: (min, max) seconds added to every answer
+       -rate_limit_ratio: share of requests answered 429 on top of the real limits
+    """
+    daemon_threads = True
+
+    def __init__(self, tournament: SyntheticTournament, host="127.0.0.1", port=0, api_key=None, latency=(0, 0),
+                 rate_limit_ratio=0.0, retry_after=1, app_limits=APP_LIMITS, method_limits=None):
+        super().__init__((host, port), RiotRequestHandler)
+        self.tournament = tournament
+        self.api_key = api_key
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.app_counter = FixedWindowCounter(app_limits)
+        self.method_counters = {method: FixedWindowCounter(limits)
+                                for method, limits in dict(METHOD_LIMITS, **(method_limits or {})).items()}
+        self.random = random.Random(tournament.seed)
+        self.stats = {"requests": 0, "rate_limited": 0}
+        self.stats_lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def env_routes(self) -> dict:
+        """.env values pointing the project to this server"""
+        return {
+            "PUUID_URL": f"{self.url}/riot/account/v1/accounts/by-riot-id/",
+            "MATCHSLIST_URL": f"{self.url}/lol/match/v5/matches/by-puuid/",
+            "MATCHDATA_URL": f"{self.url}/lol/match/v5/matches/",
+            "MATCHTIMELINE_URL": f"{self.url}/lol/match/v5/matches/"
+        }
+
+    def count(self, key: str):
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def start(self):
+        """serve in a background thread"""
+        self.thread = threading.Thread(target=self.serve_forever, name="riot-stand-in", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class RiotRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body, headers: dict):
+        payload = json.dumps(body, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        method, groups = next(((method, route.match(url.path).groups()) for method, route in ROUTES
+                               if route.match(url.path)), (None, None))
+        server.count("requests")
+        if server.latency[1]:
+            time.sleep(server.random.uniform(*server.latency))
+        if server.api_key and self.headers.get("X-Riot-Token") != server.api_key:
+            return self.send_json(403, {"status": {"message": "Forbidden", "status_code": 403}}, {})
+        if method is None:
+            return self.send_json(404, {"status": {"message": "Not found", "status_code": 404}}, {})
+
+        app_counts, app_wait = server.app_counter.hit()
+        method_counter = server.method_counters[method]
+        method_counts, method_wait = method_counter.hit()
+        headers = {"X-App-Rate-Limit": server.app_counter.limits, "X-App-Rate-Limit-Count": app_counts,
+                   "X-Method-Rate-Limit": method_counter.limits, "X-Method-Rate-Limit-Count": method_counts}
+        if app_wait or method_wait or server.random.random() < server.rate_limit_ratio:
+            server.count("rate_limited")
+            headers.update({"Retry-After": str(max(int(app_wait + 0.999), int(method_wait + 0.999), 1)
+                                               if app_wait or method_wait else server.retry_after),
+                            "X-Rate-Limit-Type": "method" if method_wait and not app_wait else "application"})
+            return self.send_json(429, {"status": {"message": "Rate limit exceeded", "status_code": 429}}, headers)
+
+        server.count(method)
+        tournament = server.tournament
+        if method == "account":
+            player = tournament.by_riot_id.get((unquote(groups[0]).lower(), unquote(groups[1]).lower()))
+            body = {"puuid": player["puuid"], "gameName": player["gameName"], "tagLine": player["tagLine"]} \
+                if player else None
+        elif method == "matchlist":
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            body = tournament.match_ids(groups[0], query.get("startTime"), query.get("endTime"),
+                                        int(query.get("start", 0)), int(query.get("count", 20)))
+        elif method == "match":
+            body = tournament.match(groups[0])
+        else:
+            body = tournament.timeline(groups[0])
+
+        if body is None:
+            return self.send_json(404, {"status": {"message": "Data not found", "status_code": 404}}, headers)
+        self.send_json(200, body, headers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in of the Riot API serving a synthetic tournament")
+    parser.add_argument("--teams", type=int, default=8)
+    parser.add_argument("--players-per-team", type=int, default=5)
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--foreign-ratio", type=float, default=0.0, help="share of games with another code")
+    parser.add_argument("--abort-ratio", type=float, default=0.0, help="share of games not completed")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, nargs=2, default=(0, 0), metavar=("MIN", "MAX"))
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument("--tournament", help="write tournaments/<name> (players.csv, codes, .config)")
+    arguments = parser.parse_args(argv)
+
+    tournament = SyntheticTournament(teams=arguments.teams, players_per_team=arguments.players_per_team,
+                                     games=arguments.games, seed=arguments.seed,
+                                     foreign_ratio=arguments.foreign_ratio, abort_ratio=arguments.abort_ratio)
+    if arguments.tournament:
+        tournament.write_tournament(arguments.tournament)
+    server = RiotStandIn(tournament, arguments.host, arguments.port,
+                         latency=tuple(value / 1000 for value in arguments.latency_ms),
+                         rate_limit_ratio=arguments.rate_limit_ratio)
+    print("Set these values in the .env file:")
+    for key, value in server.env_routes().items():
+        print(f"{key}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import bisect
+import functools
+import hashlib
+import math
+import os
+import random
+
+POSITIONS = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"]
+LANES = {"TOP": ("TOP", "SOLO"), "JUNGLE": ("JUNGLE", "NONE"), "MIDDLE": ("MIDDLE", "SOLO"),
+         "BOTTOM": ("BOTTOM", "CARRY"), "UTILITY": ("BOTTOM", "SUPPORT")}
+CHAMPIONS = {
+    "TOP": [(266, "Aatrox"), (150, "Gnar"), (24, "Jax"), (897, "KSante"), (58, "Renekton"), (516, "Ornn")],
+    "JUNGLE": [(64, "LeeSin"), (254, "Vi"), (234, "Viego"), (113, "Sejuani"), (57, "Maokai"), (5, "XinZhao")],
+    "MIDDLE": [(103, "Ahri"), (268, "Azir"), (61, "Orianna"), (134, "Syndra"), (517, "Sylas"), (163, "Taliyah")],
+    "BOTTOM": [(222, "Jinx"), (145, "Kaisa"), (110, "Varus"), (498, "Xayah"), (81, "Ezreal"), (523, "Aphelios")],
+    "UTILITY": [(412, "Thresh"), (111, "Nautilus"), (526, "Rell"), (497, "Rakan"), (117, "Lulu"), (201, "Braum")]
+}
+# per minute: lane minions, jungle monsters, xp, damage to champions
+ROLE_RATES = {"TOP": (7.0, 0.3, 420, 520), "JUNGLE": (0.8, 5.2, 360, 380), "MIDDLE": (7.6, 0.4, 440, 620),
+              "BOTTOM": (8.2, 0.2, 380, 680), "UTILITY": (1.1, 0.0, 300, 260)}
+LEVEL_XP = [0, 280, 660, 1140, 1720, 2400, 3180, 4060, 5040, 6120, 7300, 8580, 9960, 11440, 13020, 14700, 16480,
+            18360]
+DRAGONS = ["FIRE_DRAGON", "WATER_DRAGON", "EARTH_DRAGON", "AIR_DRAGON", "HEXTECH_DRAGON", "CHEMTECH_DRAGON"]
+TOWERS = [(lane, tower) for tower in ["OUTER_TURRET", "INNER_TURRET", "BASE_TURRET"]
+          for lane in ["TOP_LANE", "MID_LANE", "BOT_LANE"]] + [("MID_LANE", "NEXUS_TURRET")] * 2
+MATCHLIST_COUNT = 30  # getMatchlist asks the 30 last games of a player
+
+
+def level_of(xp: float) -> int:
+    return sum(1 for threshold in LEVEL_XP if xp >= threshold)
+
+
+class SyntheticTournament:
+    """Deterministic tournament of synthetic match-v5 / timeline payloads
+       -the schedule (teams, dates, tournament codes) is built upfront, the games are simulated on demand
+        and the last ones are cached, so 10k+ games fit in memory
+       -a game is the same for a given seed: its match and timeline agree (kills, gold, objectives...)
+       -foreign_ratio / abort_ratio: share of games with another tournament code / not completed
+    """
+
+    def __init__(self, teams=8, players_per_team=5, games=100, seed=0, start_timestamp=1704067200,
+                 hours=10, foreign_ratio=0.0, abort_ratio=0.0, cache_size=256):
+        self.seed = seed
+        self.start_timestamp = start_timestamp
+        self.end_timestamp = start_timestamp + hours * 3600
+        rnd = random.Random(f"{seed}:schedule")
+
+        self.teams = [f"Team{number:03d}" for number in range(teams)]
+        self.strength = {team: rnd.gauss(0, 1) for team in self.teams}
+        self.players = [
+            {"gameName": f"{team}P{number}", "tagLine": "SYN", "team": team, "name": f"{team} Player {number}",
+             "position": POSITIONS[number % len(POSITIONS)],
+             "puuid": hashlib.sha256(f"{seed}:{team}:{number}".encode()).hexdigest()}
+            for team in self.teams for number in range(players_per_team)]
+        self.roster = {team: [player for player in self.players if player["team"] == team] for team in self.teams}
+        self.by_puuid = {player["puuid"]: player for player in self.players}
+        self.by_riot_id = {(player["gameName"].lower(), player["tagLine"].lower()): player for player in self.players}
+
+        # series of 1 to 3 games between two teams, one tournament code per series
+        self.codes = []
+        self.schedule = []
+        while len(self.schedule) < games:
+            blue, red = rnd.sample(self.teams, 2)
+            code = f"EUW04-SYN{seed:02d}-{len(self.codes):05d}"
+            self.codes.append(code)
+            for _ in range(min(rnd.choice([1, 2, 3]), games - len(self.schedule))):
+                foreign = rnd.random() < foreign_ratio
+                self.schedule.append({
+                    "match_id": f"EUW1_{7000000000 + len(self.schedule)}",
+                    "blue": blue, "red": red,
+                    "tournamentCode": f"EUW04-OTHER-{len(self.schedule):05d}" if foreign else code,
+                    "endOfGameResult": "Abort_Unexpected" if rnd.random() < abort_ratio else "GameComplete"})
+                blue, red = red, blue
+        spacing = (self.end_timestamp - self.start_timestamp) * 1000 // max(games, 1)
+        for index, game in enumerate(self.schedule):
+            game["gameCreation"] = self.start_timestamp * 1000 + index * spacing
+        self.index = {game["match_id"]: index for index, game in enumerate(self.schedule)}
+
+        self.games_of = {player["puuid"]: [] for player in self.players}
+        for index, game in enumerate(self.schedule):
+            for puuid in self.lineup(index):
+                self.games_of[puuid].append(index)
+        self.game = functools.lru_cache(maxsize=cache_size)(self.simulate_game)
+
+    def lineup(self, index: int) -> list:
+        """puuids of the 10 participants of a game, blue side first, in position order"""
+        rnd = random.Random(f"{self.seed}:lineup:{index}")
+        game = self.schedule[index]
+        puuids = []
+        for team in (game["blue"], game["red"]):
+            for position in POSITIONS:
+                candidates = [player for player in self.roster[team] if player["position"] == position]
+                puuids.append(rnd.choice(candidates)["puuid"] if candidates else
+                              hashlib.sha256(f"{self.seed}:{team}:{position}:sub".encode()).hexdigest())
+        return puuids
+
+    def match_ids(self, puuid: str, start_time=None, end_time=None, start=0, count=MATCHLIST_COUNT) -> list:
+        """matchlist of a player, most recent first, like match-v5 by-puuid/{puuid}/ids"""
+        ids = [self.schedule[index]["match_id"] for index in reversed(self.games_of.get(puuid, []))
+               if (start_time is None or self.schedule[index]["gameCreation"] >= int(start_time) * 1000)
+               and (end_time is None or self.schedule[index]["gameCreation"] <= int(end_time) * 1000)]
+        return ids[start:start + count]
+
+    def match(self, match_id: str):
+        return self.game(self.index[match_id])[0] if match_id in self.index else None
+
+    def timeline(self, match_id: str):
+        return self.game(self.index[match_id])[1] if match_id in self.index else None
+
+    def simulate_game(self, index: int) -> tuple:
+        """return the (match, timeline) payloads of a game"""
+        rnd = random.Random(f"{self.seed}:game:{index}")
+        game = self.schedule[index]
+        puuids = self.lineup(index)
+        positions = POSITIONS * 2
+        team_ids = [100] * 5 + [200] * 5
+        blue_chance = 1 / (1 + math.exp(self.strength[game["red"]] - self.strength[game["blue"]]))
+        blue_win = rnd.random() < blue_chance
+        winner = 100 if blue_win else 200
+        duration = rnd.randint(22 * 60, 40 * 60)
+        minutes = duration // 60
+        champions = [rnd.sample(CHAMPIONS[position], 2) for position in POSITIONS]
+        champions = [champions[slot % 5][slot // 5] for slot in range(10)]
+
+        def team_of(participant_id):
+            return team_ids[participant_id - 1]
+
+        def pick(team_id):
+            return rnd.randint(1, 5) + (0 if team_id == 100 else 5)
+
+        def biased_team(bias=0.62):
+            return winner if rnd.random() < bias else 300 - winner
+
+        events = []
+        for _ in range(rnd.randint(12, 45)):
+            killer_team = biased_team()
+            killer = pick(killer_team)
+            assists = rnd.sample([p for p in range(1, 11) if team_of(p) == killer_team and p != killer],
+                                 rnd.randint(0, 3))
+            events.append({"type": "CHAMPION_KILL", "timestamp": rnd.randint(150000, duration * 1000 - 5000),
+                           "killerId": killer, "victimId": pick(300 - killer_team),
+                           "assistingParticipantIds": assists, "bounty": 300, "shutdownBounty": 0,
+                           "position": {"x": rnd.randint(500, 14500), "y": rnd.randint(500, 14500)}})
+        for team_id, towers in ((winner, rnd.randint(6, 11)), (300 - winner, rnd.randint(0, 5))):
+            times = sorted(rnd.randint(9 * 60000, duration * 1000 - 10000) for _ in range(towers))
+            for timestamp, (lane, tower) in zip(times, TOWERS):
+                killer = pick(team_id)
+                events.append({"type": "BUILDING_KILL", "timestamp": timestamp, "killerId": killer,
+                               "teamId": 300 - team_id, "buildingType": "TOWER_BUILDING", "laneType": lane,
+                               "towerType": tower, "assistingParticipantIds": [],
+                               "position": {"x": rnd.randint(500, 14500), "y": rnd.randint(500, 14500)}})
+        timestamp = rnd.randint(5 * 60000, 7 * 60000)
+        while timestamp < duration * 1000 - 30000:
+            team_id = biased_team(0.6)
+            events.append({"type": "ELITE_MONSTER_KILL", "timestamp": timestamp, "killerId": pick(team_id),
+                           "killerTeamId": team_id, "monsterType": "DRAGON", "monsterSubType": rnd.choice(DRAGONS),
+                           "assistingParticipantIds": []})
+            timestamp += rnd.randint(5 * 60000, 7 * 60000)
+        for timestamp in sorted(rnd.sample(range(14 * 60000, 19 * 60000, 1000), rnd.randint(0, 1))):
+            team_id = biased_team(0.55)
+            events.append({"type": "ELITE_MONSTER_KILL", "timestamp": timestamp, "killerId": pick(team_id),
+                           "killerTeamId": team_id, "monsterType": "RIFTHERALD", "assistingParticipantIds": []})
+        timestamp = rnd.randint(21 * 60000, 26 * 60000)
+        while timestamp < duration * 1000 - 60000:
+            team_id = biased_team(0.7)
+            events.append({"type": "ELITE_MONSTER_KILL", "timestamp": timestamp, "killerId": pick(team_id),
+                           "killerTeamId": team_id, "monsterType": "BARON_NASHOR", "assistingParticipantIds": []})
+            timestamp += rnd.randint(7 * 60000, 11 * 60000)
+        events.sort(key=lambda event: event["timestamp"])
+        events.append({"type": "GAME_END", "timestamp": duration * 1000, "winningTeam": winner, "gameId": index})
+
+        kills = [e for e in events if e["type"] == "CHAMPION_KILL"]
+        towers = [e for e in events if e["type"] == "BUILDING_KILL"]
+        monsters = [e for e in events if e["type"] == "ELITE_MONSTER_KILL"]
+
+        # cumulative per-minute frames, gold follows the farm, the kills and the assists
+        skill = [1 + rnd.uniform(-0.15, 0.15) + (0.06 if team_ids[slot] == winner else -0.06) for slot in range(10)]
+        kill_times = [[e["timestamp"] for e in kills if e["killerId"] == slot + 1] for slot in range(10)]
+        assist_times = [[e["timestamp"] for e in kills if slot + 1 in e["assistingParticipantIds"]]
+                        for slot in range(10)]
+        frames = []
+        frame_times = list(range(0, duration * 1000, 60000)) + [duration * 1000]
+        for number, frame_time in enumerate(frame_times):
+            participant_frames = {}
+            for slot in range(10):
+                participant_id = slot + 1
+                lane_rate, jungle_rate, xp_rate, damage_rate = ROLE_RATES[positions[slot]]
+                played = max(frame_time / 60000 - 1.5, 0)
+                cs = int(lane_rate * skill[slot] * played)
+                jungle_cs = int(jungle_rate * skill[slot] * played)
+                slot_kills = bisect.bisect_right(kill_times[slot], frame_time)
+                slot_assists = bisect.bisect_right(assist_times[slot], frame_time)
+                gold = int(500 + 122 * played + 21 * cs + 35 * jungle_cs + 300 * slot_kills + 150 * slot_assists)
+                xp = int(xp_rate * skill[slot] * frame_time / 60000 + 150 * slot_kills)
+                damage = int(damage_rate * skill[slot] * max(frame_time / 60000 - 3, 0) ** 1.15)
+                participant_frames[str(participant_id)] = {
+                    "participantId": participant_id, "minionsKilled": cs, "jungleMinionsKilled": jungle_cs,
+                    "totalGold": gold, "currentGold": rnd.randint(0, 1500) if number else 500, "xp": xp,
+                    "level": level_of(xp), "timeEnemySpentControlled": int(played * rnd.randint(200, 900)),
+                    "damageStats": {"totalDamageDoneToChampions": damage,
+                                    "totalDamageTaken": int(damage * rnd.uniform(0.8, 1.3))},
+                    "position": {"x": rnd.randint(500, 14500), "y": rnd.randint(500, 14500)}}
+            window_end = frame_times[number + 1] if number + 1 < len(frame_times) else duration * 1000 + 1
+            frames.append({"timestamp": frame_time, "participantFrames": participant_frames,
+                           "events": [e for e in events if frame_time <= e["timestamp"] < window_end]})
+        last = frames[-1]["participantFrames"]
+
+        team_kills = {team_id: sum(1 for e in kills if team_of(e["killerId"]) == team_id) for team_id in (100, 200)}
+        team_damage = {team_id: sum(last[str(p)]["damageStats"]["totalDamageDoneToChampions"]
+                                    for p in range(1, 11) if team_of(p) == team_id) for team_id in (100, 200)}
+        team_taken = {team_id: sum(last[str(p)]["damageStats"]["totalDamageTaken"]
+                                   for p in range(1, 11) if team_of(p) == team_id) for team_id in (100, 200)}
+        first_kill = kills[0]["killerId"] if kills else None
+        first_tower = towers[0]["killerId"] if towers else None
+
+        def objective(team_id, selected):
+            return {"first": bool(selected) and team_of(selected[0]["killerId"]) == team_id,
+                    "kills": sum(1 for e in selected if team_of(e["killerId"]) == team_id)}
+
+        participants = []
+        for slot in range(10):
+            participant_id, team_id, position = slot + 1, team_ids[slot], positions[slot]
+            frame = last[str(participant_id)]
+            player = self.by_puuid.get(puuids[slot], {})
+            slot_kills = sum(1 for e in kills if e["killerId"] == participant_id)
+            deaths = sum(1 for e in kills if e["victimId"] == participant_id)
+            assists = sum(1 for e in kills if participant_id in e["assistingParticipantIds"])
+            damage = frame["damageStats"]["totalDamageDoneToChampions"]
+            taken = frame["damageStats"]["totalDamageTaken"]
+            magic = rnd.uniform(0.1, 0.7)
+            true = rnd.uniform(0.02, 0.1)
+            takedowns = {monster: sum(1 for e in monsters if e["monsterType"] == monster and
+                                      (e["killerId"] == participant_id or rnd.random() < 0.4) and
+                                      e["killerTeamId"] == team_id)
+                         for monster in ("DRAGON", "RIFTHERALD", "BARON_NASHOR")}
+            lane_first_10 = int(ROLE_RATES[position][0] * skill[slot] * 8.5)
+            participants.append({
+                "participantId": participant_id, "puuid": puuids[slot], "teamId": team_id,
+                "riotIdGameName": player.get("gameName", "Sub"), "riotIdTagline": player.get("tagLine", "SYN"),
+                "summonerName": player.get("gameName", "Sub"), "teamPosition": position,
+                "individualPosition": position, "lane": LANES[position][0], "role": LANES[position][1],
+                "championId": champions[slot][0], "championName": champions[slot][1],
+                "champLevel": frame["level"], "win": team_id == winner,
+                "kills": slot_kills, "deaths": deaths, "assists": assists,
+                "firstBloodKill": first_kill == participant_id,
+                "firstBloodAssist": bool(kills) and participant_id in kills[0]["assistingParticipantIds"],
+                "firstTowerKill": first_tower == participant_id, "firstTowerAssist": False,
+                "goldEarned": frame["totalGold"], "goldSpent": int(frame["totalGold"] * rnd.uniform(0.85, 0.98)),
+                "totalMinionsKilled": frame["minionsKilled"], "neutralMinionsKilled": frame["jungleMinionsKilled"],
+                "totalDamageDealtToChampions": damage,
+                "magicDamageDealtToChampions": int(damage * magic),
+                "trueDamageDealtToChampions": int(damage * true),
+                "physicalDamageDealtToChampions": damage - int(damage * magic) - int(damage * true),
+                "totalDamageDealt": damage * rnd.randint(5, 9),
+                "magicDamageDealt": int(damage * magic * 6), "trueDamageDealt": int(damage * true * 8),
+                "physicalDamageDealt": int(damage * (1 - magic - true) * 7),
+                "totalDamageTaken": taken, "magicDamageTaken": int(taken * 0.4),
+                "physicalDamageTaken": int(taken * 0.5), "trueDamageTaken": taken - int(taken * 0.4) - int(taken * 0.5),
+                "damageSelfMitigated": int(taken * rnd.uniform(0.3, 1.5)),
+                "damageDealtToBuildings": sum(rnd.randint(800, 2500) for e in towers if e["killerId"] == participant_id),
+                "damageDealtToTurrets": sum(rnd.randint(800, 2500) for e in towers if e["killerId"] == participant_id),
+                "damageDealtToObjectives": sum(rnd.randint(1500, 6000) for e in monsters
+                                               if e["killerId"] == participant_id),
+                "turretKills": sum(1 for e in towers if e["killerId"] == participant_id),
+                "turretsLost": sum(1 for e in towers if e["teamId"] == team_id),
+                "inhibitorKills": 0, "objectivesStolen": int(rnd.random() < 0.03),
+                "largestCriticalStrike": rnd.randint(0, 1200) if position in ("BOTTOM", "TOP") else 0,
+                "largestMultiKill": min(max(slot_kills, 1), rnd.randint(1, 3)) if slot_kills else 0,
+                "largestKillingSpree": min(slot_kills, rnd.randint(0, 5)),
+                "doubleKills": int(slot_kills >= 2 and rnd.random() < 0.3), "tripleKills": 0, "quadraKills": 0,
+                "pentaKills": int(slot_kills >= 5 and rnd.random() < 0.02),
+                "timeCCingOthers": rnd.randint(5, 60), "totalTimeCCDealt": rnd.randint(50, 900),
+                "totalHeal": rnd.randint(500, 12000), "totalHealsOnTeammates": rnd.randint(0, 4000),
+                "totalDamageShieldedOnTeammates": rnd.randint(0, 6000) if position == "UTILITY" else 0,
+                "totalTimeSpentDead": sum(int(6 + e["timestamp"] / 60000 * 1.2) for e in kills
+                                          if e["victimId"] == participant_id),
+                "visionScore": int(minutes * (2.5 if position == "UTILITY" else 1.0) * rnd.uniform(0.7, 1.3)),
+                "wardsPlaced": int(minutes * (1.2 if position == "UTILITY" else 0.4) * rnd.uniform(0.7, 1.3)),
+                "wardsKilled": rnd.randint(0, 20), "detectorWardsPlaced": rnd.randint(0, 8),
+                "visionWardsBoughtInGame": rnd.randint(0, 10),
+                "challenges": {
+                    "damagePerMinute": damage / (duration / 60),
+                    "goldPerMinute": frame["totalGold"] / (duration / 60),
+                    "kda": (slot_kills + assists) / max(deaths, 1),
+                    "killParticipation": (slot_kills + assists) / team_kills[team_id] if team_kills[team_id] else 0,
+                    "teamDamagePercentage": damage / team_damage[team_id] if team_damage[team_id] else 0,
+                    "damageTakenOnTeamPercentage": taken / team_taken[team_id] if team_taken[team_id] else 0,
+                    "firstTurretKilled": int(first_tower == participant_id),
+                    "laneMinionsFirst10Minutes": lane_first_10,
+                    "soloKills": sum(1 for e in kills if e["killerId"] == participant_id
+                                     and not e["assistingParticipantIds"]),
+                    "dragonTakedowns": takedowns["DRAGON"], "riftHeraldTakedowns": takedowns["RIFTHERALD"],
+                    "baronTakedowns": takedowns["BARON_NASHOR"],
+                    "teamBaronKills": sum(1 for e in monsters if e["monsterType"] == "BARON_NASHOR"
+                                          and e["killerTeamId"] == team_id),
+                    "teamRiftHeraldKills": sum(1 for e in monsters if e["monsterType"] == "RIFTHERALD"
+                                               and e["killerTeamId"] == team_id),
+                    "turretPlatesTaken": rnd.randint(0, 5) if position != "JUNGLE" else rnd.randint(0, 2),
+                    "voidMonsterKill": rnd.randint(0, 3) if position == "JUNGLE" else 0,
+                    "stealthWardsPlaced": int(minutes * (1.0 if position == "UTILITY" else 0.3)),
+                    "wardTakedowns": rnd.randint(0, 15),
+                    "survivedSingleDigitHpCount": int(rnd.random() < 0.15)
+                }
+            })
+
+        teams = [{
+            "teamId": team_id, "win": team_id == winner,
+            "bans": [{"championId": rnd.randint(1, 900), "pickTurn": turn + 1} for turn in range(5)],
+            "objectives": {
+                "champion": {"first": bool(kills) and team_of(kills[0]["killerId"]) == team_id,
+                             "kills": team_kills[team_id]},
+                "tower": objective(team_id, towers),
+                "dragon": objective(team_id, [e for e in monsters if e["monsterType"] == "DRAGON"]),
+                "riftHerald": objective(team_id, [e for e in monsters if e["monsterType"] == "RIFTHERALD"]),
+                "baron": objective(team_id, [e for e in monsters if e["monsterType"] == "BARON_NASHOR"]),
+                "inhibitor": {"first": False, "kills": 0}}
+        } for team_id in (100, 200)]
+
+        metadata = {"dataVersion": "2", "matchId": game["match_id"], "participants": puuids}
+        match = {"metadata": metadata, "info": {
+            "gameId": 7000000000 + index, "platformId": "EUW1", "gameMode": "CLASSIC", "gameType": "CUSTOM_GAME",
+            "mapId": 11, "queueId": 0, "gameVersion": "14.1.555.5555", "gameCreation": game["gameCreation"],
+            "gameStartTimestamp": game["gameCreation"] + 30000,
+            "gameEndTimestamp": game["gameCreation"] + 30000 + duration * 1000, "gameDuration": duration,
+            "tournamentCode": game["tournamentCode"], "endOfGameResult": game["endOfGameResult"],
+            "participants": participants, "teams": teams}}
+        timeline = {"metadata": metadata, "info": {
+            "gameId": 7000000000 + index, "frameInterval": 60000, "endOfGameResult": game["endOfGameResult"],
+            "participants": [{"participantId": slot + 1, "puuid": puuids[slot]} for slot in range(10)],
+            "frames": frames}}
+        return match, timeline
+
+    def write_tournament(self, tournament: str):
+        """write the players.csv, tournamentCodes.txt and .config files of tournaments/{tournament}"""
+        directory = f"tournaments/{tournament}"
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{directory}/players.csv", "w", encoding="utf-8") as file:
+            file.write("gameName;tagLine;team;name\n")
+            for player in self.players:
+                file.write(f"{player['gameName']};{player['tagLine']};{player['team']};{player['name']}\n")
+        with open(f"{directory}/tournamentCodes.txt", "w") as file:
+            file.write("\n".join(self.codes) + "\n")
+        with open(f"{directory}/.config", "w") as file:
+            file.write(f"START_TIMESTAMP={self.start_timestamp}\nEND_TIMESTAMP={self.end_timestamp}\n")